@@ -0,0 +1,226 @@
+#Alignment tools of the Initial Allignment Assistant: sensitivities of the beam to the yaws and pitches of the elements
+#Only needs numpy (and Core.py)
+#Importing the loading and calculation functions form Core.py (and Optics.py through it)
+from Core import *
+
+#Imports numpy
+import numpy as np
+
+#Returns the beam centers on every element (in the frame of the element, as "BeamCenter" in calculatePlotParameters) for a batch of beams and extra yaws and pitches, shape (count, number of elements, 2)
+#Also returns the beam directions after every element, shape (count, number of elements, 3)
+def beamCentersArrays(batch, system, extraYaws, extraPitches):
+    states = batch.calculateStates(system, extraYaws, extraPitches)
+    centers = np.zeros((len(batch), len(system), 2))
+    directions = np.zeros((len(batch), len(system), 3))
+    for i in range(len(system)):
+        state = states[system.IDs[i]]
+        pitch, yaw = system.angles(i, extraYaws, extraPitches)
+        centers[:, i] = rotatePitchYawArray(state.position - system.positionOfCM[i], -pitch, -yaw)[:, 1:]
+        directions[:, i] = state.direction
+    return centers, directions
+
+#Returns the sensitivity of the beam to the yaw and pitch of the movable elements (all of them by default), around the given extra yaws and pitches (zero by default)
+#The derivatives are central differences with the given step (in radians), all 4 per movable element are traced together in one BeamBatch of 4*(number of movable elements) + 1 beams
+#Returns a dictionary with:
+#   "Centers": beam center on each element, in the frame of the element, shape (number of elements, 2)
+#   "CenterJacobian": d(center on element j)/d(yaw, pitch of movable element i), indexed as [j, coordinate, i, 0 for yaw or 1 for pitch]
+#   "Directions": beam direction after each element, shape (number of elements, 3)
+#   "DirectionJacobian": d(direction after element j)/d(yaw, pitch of movable element i), indexed as [j, coordinate, i, 0 for yaw or 1 for pitch]
+def calculateJacobian(beam, elements, extraYaws = None, extraPitches = None, step = 1e-6, movableIDs = None):
+    system = compileSystem(elements)
+    if extraYaws is None:
+        extraYaws = np.zeros(len(system))
+    if extraPitches is None:
+        extraPitches = np.zeros(len(system))
+    if movableIDs is None:
+        movableIDs = list(system.IDs)
+    indices = np.array([system.IDs.index(ID) for ID in movableIDs], dtype = int)
+    count = len(indices)
+
+    #Beam 0 is the one around which the derivatives are taken, then +yaw, -yaw, +pitch, -pitch for each movable element
+    yaws = np.tile(np.asarray(extraYaws, dtype = float), (4*count + 1, 1))
+    pitches = np.tile(np.asarray(extraPitches, dtype = float), (4*count + 1, 1))
+    rows = np.arange(count)
+    yaws[1 + 4*rows, indices] += step
+    yaws[2 + 4*rows, indices] -= step
+    pitches[3 + 4*rows, indices] += step
+    pitches[4 + 4*rows, indices] -= step
+
+    centers, directions = beamCentersArrays(beam.toBatch(4*count + 1), system, yaws, pitches)
+
+    #Moves the element being changed to the last axis, [j, coordinate, i]
+    centerYaw = ((centers[1::4] - centers[2::4])/(2*step)).transpose(1, 2, 0)
+    centerPitch = ((centers[3::4] - centers[4::4])/(2*step)).transpose(1, 2, 0)
+    directionYaw = ((directions[1::4] - directions[2::4])/(2*step)).transpose(1, 2, 0)
+    directionPitch = ((directions[3::4] - directions[4::4])/(2*step)).transpose(1, 2, 0)
+
+    return {
+            "ElementsIDs": list(system.IDs),
+            "MovableIDs": list(movableIDs),
+            "Centers": centers[0],
+            "CenterJacobian": np.stack([centerYaw, centerPitch], axis = -1),
+            "Directions": directions[0],
+            "DirectionJacobian": np.stack([directionYaw, directionPitch], axis = -1)
+           }
+
+#Returns the extra yaws and pitches of the control elements that put the beam centers on the view elements at their targets, targets = {viewID: [y, z]} (in the frame of the view element, as "BeamCenter")
+#Starts from the given extra yaws and pitches (zero by default) and takes Gauss-Newton steps (least squares, so there can be more or fewer targets than controls) with the Jacobian of calculateJacobian, halving a step while it does not reduce the error
+#The trial steps are traced with a single beam, the Jacobian (4*(number of controls) + 1 beams) is only calculated at the points that were accepted
+#Returns a dictionary with the full arrays of extra yaws and pitches, the beam centers reached on the view elements, the remaining error, and the flags at the solution
+#"Success" is only True if the targets were reached within tolerance (same units as the positions) and the beam is not clipping or missing any element there
+def solveAlignment(beam, elements, targets, controlIDs, extraYaws = None, extraPitches = None, tolerance = 1e-6, maxIterations = 20, step = 1e-6):
+    system = compileSystem(elements)
+    if extraYaws is None:
+        extraYaws = np.zeros(len(system))
+    if extraPitches is None:
+        extraPitches = np.zeros(len(system))
+    extraYaws = np.array(extraYaws, dtype = float)
+    extraPitches = np.array(extraPitches, dtype = float)
+    viewIDs = list(targets)
+    views = [indexOfElement(system.IDs, ID) for ID in viewIDs]
+    controls = [indexOfElement(system.IDs, ID) for ID in controlIDs]
+    target = np.array([targets[ID] for ID in viewIDs], dtype = float).ravel()
+
+    #Beam centers on every element for one set of extra yaws and pitches, traced with a single beam
+    single = beam.toBatch(1)
+    def traceCenters(yaws, pitches):
+        return beamCentersArrays(single, system, yaws[np.newaxis], pitches[np.newaxis])[0][0]
+
+    centers = traceCenters(extraYaws, extraPitches)
+    residual = centers[views].ravel() - target
+    iterations = 0
+    while np.abs(residual).max() > tolerance and iterations < maxIterations:
+        iterations = iterations + 1
+        #The Jacobian is only calculated at the accepted points, the trial steps below trace a single beam
+        jacobian = calculateJacobian(beam, system, extraYaws, extraPitches, step = step, movableIDs = controlIDs)
+        #Rows are the coordinates of the centers on the views, columns are the yaws and then the pitches of the controls
+        matrix = jacobian["CenterJacobian"][views].reshape(len(views)*2, len(controls), 2)
+        matrix = np.concatenate([matrix[:, :, 0], matrix[:, :, 1]], axis = 1)
+        change = np.linalg.lstsq(matrix, -residual, rcond = None)[0]
+
+        #Halves the step until it reduces the error
+        scale = 1.0
+        improved = False
+        for i in range(10):
+            newYaws = extraYaws.copy()
+            newPitches = extraPitches.copy()
+            newYaws[controls] += scale*change[:len(controls)]
+            newPitches[controls] += scale*change[len(controls):]
+            newCenters = traceCenters(newYaws, newPitches)
+            newResidual = newCenters[views].ravel() - target
+            if np.all(np.isfinite(newResidual)) and np.linalg.norm(newResidual) < np.linalg.norm(residual):
+                improved = True
+                break
+            scale = scale/2.0
+        if not improved:
+            break
+        extraYaws, extraPitches, centers, residual = newYaws, newPitches, newCenters, newResidual
+
+    converged = bool(np.abs(residual).max() <= tolerance)
+    codes = beam.toBatch(1).calculateFlags(system, extraYaws[np.newaxis], extraPitches[np.newaxis])[0]
+    flags = flagMessages(codes, system.elements())
+    clippingFree = not codes.any()
+    if not converged:
+        message = "Targets not reached, remaining error of " + str(np.abs(residual).max())
+    elif not clippingFree:
+        message = "Targets reached, but there is no clipping free solution from this starting point"
+    else:
+        message = "Targets reached"
+
+    return {
+            "ExtraYaws": extraYaws,
+            "ExtraPitches": extraPitches,
+            "Centers": dict((viewIDs[i], centers[views[i]]) for i in range(len(views))),
+            "Error": np.abs(residual).max(),
+            "Iterations": iterations,
+            "Converged": converged,
+            "ClippingFree": clippingFree,
+            "Flags": flags,
+            "Success": converged and clippingFree,
+            "Message": message
+           }
+
+#Regions of yaw-pitch space for findBoundary, each takes the flag codes of BeamBatch.calculateFlags, shape (count, number of elements), and tells which beams are inside
+#Inside when there is no clipping or missing element at all
+def clearRegion(flags):
+    return ~np.any(flags, axis = -1)
+
+#Inside while the beam reaches the last element (the criterion of the old findRanges scan)
+def lastElementRegion(flags):
+    return (flags[:, -1] & FLAG_MISSED) == 0
+
+#Finds the boundary of the region (clearRegion by default) around the current yaw and pitch of one movable element, along rays evenly spread in yaw-pitch space
+#Along each ray the angle is doubled from initialStep until the beam leaves the region (or maxAngle is reached), then the boundary is bisected down to tolerance (in radians)
+#All rays are traced together in one BeamBatch per step, so it takes about log2(maxAngle/initialStep) + log2(maxAngle/tolerance) batched traces
+#Only the first boundary along each ray is found, so thin regions that come back further out are missed
+#Returns a dictionary with the polygon of the region, as the [extra yaw, extra pitch] of the last inside point along each ray, and its bounding box [[yawMin, yawMax], [pitchMin, pitchMax]]
+def findBoundary(beam, elements, movableID, rays = 32, tolerance = 1e-6, initialStep = 1e-5, maxAngle = np.pi/4, region = clearRegion, extraYaws = None, extraPitches = None):
+    system = compileSystem(elements)
+    if extraYaws is None:
+        extraYaws = np.zeros(len(system))
+    if extraPitches is None:
+        extraPitches = np.zeros(len(system))
+    index = system.IDs.index(movableID)
+    angles = np.linspace(0, 2*np.pi, num = rays, endpoint = False)
+    batch = beam.toBatch(rays)
+    traces = [0]
+
+    #Tells which of the points at the given distances along the rays are inside the region
+    def inside(distances):
+        yaws = np.tile(np.asarray(extraYaws, dtype = float), (rays, 1))
+        pitches = np.tile(np.asarray(extraPitches, dtype = float), (rays, 1))
+        yaws[:, index] += distances*np.cos(angles)
+        pitches[:, index] += distances*np.sin(angles)
+        traces[0] = traces[0] + 1
+        return region(batch.calculateFlags(system, yaws, pitches))
+
+    nominalInside = bool(inside(np.zeros(rays))[0])
+    inner = np.zeros(rays)
+    outer = np.full(rays, initialStep)
+    if nominalInside:
+        #Doubles the distance along the rays that are still inside
+        growing = np.ones(rays, dtype = bool)
+        while growing.any():
+            isInside = inside(outer)
+            inner = np.where(growing & isInside, outer, inner)
+            growing = growing & isInside & (outer < maxAngle)
+            outer = np.where(growing, np.minimum(2*outer, maxAngle), outer)
+        #Rays that never left the region stop at maxAngle
+        unbounded = outer - inner <= 0
+        #Bisects between the last inside and the first outside points
+        while np.any(outer - inner > tolerance):
+            middle = (inner + outer)/2.0
+            isInside = inside(middle)
+            inner = np.where(isInside, middle, inner)
+            outer = np.where(isInside, outer, middle)
+        inner = np.where(unbounded, maxAngle, inner)
+    else:
+        inner = np.zeros(rays)
+
+    polygon = np.stack([inner*np.cos(angles), inner*np.sin(angles)], axis = -1)
+    return {
+            "MovableID": movableID,
+            "NominalInside": nominalInside,
+            "Angles": angles,
+            "Polygon": polygon,
+            "Ranges": [[float(polygon[:, 0].min()), float(polygon[:, 0].max())], [float(polygon[:, 1].min()), float(polygon[:, 1].max())]],
+            "Traces": traces[0]
+           }
+
+#Returns the yaw and pitch ranges, [[yawMin, yawMax], [pitchMin, pitchMax]] for each movable element (in the order of movableElements), in which the beam still reaches the last element of the system, widened by margin
+#Same output as the old scanning findRanges of Plots.ipynb, but with findBoundary along rays
+#Raises a ValueError for an element that is not in the system, or when the nominal beam does not reach the last element
+def findRanges(system, movableElements, margin = 1.2, rays = 16, tolerance = 1e-6):
+    beam = beamFromFile('Systems/' + system)
+    elements = elementsFromFile('Systems/' + system)
+    opticalSystem = OpticalSystem(elements)
+    for ID in movableElements:
+        indexOfElement(opticalSystem.IDs, ID, system)
+    ranges = []
+    for ID in movableElements:
+        boundary = findBoundary(beam, opticalSystem, ID, rays = rays, tolerance = tolerance, region = lastElementRegion)
+        #Without its extra yaw and pitch the beam has to reach the last element, there is no range around it otherwise
+        if not boundary["NominalInside"]:
+            raise ValueError("The beam does not reach the last element of " + system + " with " + str(ID) + " at its nominal yaw and pitch, there is no range to find")
+        ranges += [[[boundary["Ranges"][0][0]*margin, boundary["Ranges"][0][1]*margin], [boundary["Ranges"][1][0]*margin, boundary["Ranges"][1][1]*margin]]]
+    return ranges
@@ -0,0 +1,165 @@
+#Benchmarks of the Initial Allignment Assistant: times the tracing, flagging, plotting, tracking, loading and sweeps on the shipped systems and a synthetic long chain
+#Each run is appended to a history file (one JSON object per line) and compared against a stored baseline
+#Usage: python Benchmarks.py [--quick] [--save-baseline] [--threshold 1.2]
+#Only needs numpy (and Core.py)
+#Importing the loading and calculation functions form Core.py (and Optics.py through it)
+from Core import *
+
+#Imports numpy
+import numpy as np
+#Imports the standard library modules for the timing, the history and the command line
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+
+#Systems used by the benchmarks (besides the synthetic chain)
+benchmarkSystems = ['Example01 - Default.ini', 'HAM2 - Default.ini', 'PRC - Default.ini']
+#Default paths of the history and baseline files
+historyPath = 'BenchmarkResults/history.jsonl'
+baselinePath = 'BenchmarkResults/baseline.json'
+
+#Returns a beam and a chain of count flat mirrors making a periscope staircase (+x, +y, +x, +y...), all at yaw 3*pi/4 so each one turns the beam by 90 degrees
+def syntheticChain(count = 200, spacing = 100.0, diameter = 50.0):
+    beam = Beam(radiusOfCurvature = 1.0E6, width = 1.0, direction = [1,0,0], position = [0,0,0], wavelength = 1064.0E-9, indexOfRefraction = 1, verbose = False)
+    elements = []
+    for i in range(count):
+        positionOfCM = [spacing*(i//2 + 1), spacing*((i + 1)//2), 0]
+        elements.append(FlatMirror(ID = 'M' + '{:03d}'.format(i + 1), positionOfCM = positionOfCM, parameter_d = 0, yaw = 3*np.pi/4, pitch = 0, diameter = diameter))
+    return beam, elements
+
+#Returns the best and median times (in seconds) of calling function repeat times
+def timeFunction(function, repeat):
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times), float(np.median(times))
+
+#Times every benchmark of one system, returns a dictionary of {benchmark name: (best, median)}
+#filepath is None for systems that do not come from a file (the loading is then not timed)
+def benchmarkSystem(beam, elements, filepath = None, repeat = 5, sweepDetail = 100):
+    beam = beam.copy()
+    results = {}
+    results['calculateStates'] = timeFunction(lambda: beam.calculateStates(elements), repeat)
+    results['calculateFlags'] = timeFunction(lambda: beam.calculateFlags(elements), repeat)
+
+    #Alternates the nudge of the first element, so the plots trace the whole chain every time as when a user moves it
+    extraYaws = np.zeros(len(elements))
+    extraPitches = np.zeros(len(elements))
+    def plot():
+        extraYaws[0] = 1e-6 - extraYaws[0]
+        calculatePlotParameters(beam, elements, elements[-1].ID, elements[0].ID, extraYaws, extraPitches)
+    results['calculatePlotParameters'] = timeFunction(plot, repeat)
+
+    #Step such that the track has about 1000 samples
+    step = 1.0
+    step = step*beam.trackCount(beam.trackSegments(elements, step))/1000.0
+    results['track'] = timeFunction(lambda: beam.track(elements, step), repeat)
+    results['trackArrays'] = timeFunction(lambda: beam.trackArrays(elements, step), repeat)
+
+    if filepath is not None:
+        #Parsing the system file (a second load in the same process only looks it up, which is not worth timing)
+        results['parseSystem'] = timeFunction(lambda: loadSystem(filepath, useCache = False), repeat)
+
+    #Fixed size sweep of the first element, sweepDetail x sweepDetail points in one process
+    system = OpticalSystem(elements)
+    yaws = np.repeat(np.linspace(-1e-3, 1e-3, num = sweepDetail), sweepDetail)
+    pitches = np.tile(np.linspace(-1e-3, 1e-3, num = sweepDetail), sweepDetail)
+    results['sweep'] = timeFunction(lambda: tracePoints(beam, system, 0, len(system) - 1, yaws, pitches), max(1, repeat//2))
+    return results
+
+#Runs all the benchmarks, returns a dictionary of {"system/benchmark": (best, median)}
+def runBenchmarks(repeat = 5, sweepDetail = 100, chainLength = 200):
+    results = {}
+    for system in benchmarkSystems:
+        filepath = 'Systems/' + system
+        for name, value in benchmarkSystem(beamFromFile(filepath), elementsFromFile(filepath), filepath = filepath, repeat = repeat, sweepDetail = sweepDetail).items():
+            results[system[:-4] + '/' + name] = value
+    beam, elements = syntheticChain(chainLength)
+    for name, value in benchmarkSystem(beam, elements, repeat = repeat, sweepDetail = sweepDetail).items():
+        results['Chain' + str(chainLength) + '/' + name] = value
+    return results
+
+#Returns the current git commit, or None outside of a git repository
+def currentCommit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr = subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+#Returns the record of a run, as written to the history and baseline files (times are the best of the repeats, in seconds)
+def benchmarkRecord(results):
+    return {
+            "time": time.strftime('%Y-%m-%dT%H:%M:%S'),
+            "commit": currentCommit(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "results": dict((name, results[name][0]) for name in results),
+            "medians": dict((name, results[name][1]) for name in results)
+           }
+
+#Appends a record to a file, one JSON object per line
+def appendRecord(record, path):
+    if os.path.dirname(path) != '' and not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, 'a') as f:
+        f.write(json.dumps(record, sort_keys = True) + '\n')
+
+#Compares the results of a record against a baseline record, returns a list of (name, baseline, now, ratio, regressed) for the benchmarks in both
+def compareToBaseline(record, baseline, threshold = 1.2):
+    rows = []
+    for name in sorted(record["results"]):
+        if name in baseline["results"]:
+            ratio = record["results"][name]/baseline["results"][name]
+            rows.append((name, baseline["results"][name], record["results"][name], ratio, ratio > threshold))
+    return rows
+
+#Prints the results, and their comparison with the baseline if there is one
+def printResults(record, rows = None):
+    if rows is None:
+        for name in sorted(record["results"]):
+            print('{:<45}{:>12.6f} s'.format(name, record["results"][name]))
+        return
+    print('{:<45}{:>12}{:>12}{:>9}'.format('Benchmark', 'Baseline', 'Now', 'Ratio'))
+    for name, before, now, ratio, regressed in rows:
+        print('{:<45}{:>12.6f}{:>12.6f}{:>9.2f}'.format(name, before, now, ratio) + ('  <-- slower' if regressed else ''))
+
+def main(arguments = None):
+    parser = argparse.ArgumentParser(description = 'Benchmarks of the Initial Allignment Assistant')
+    parser.add_argument('--quick', action = 'store_true', help = 'fewer repeats and a smaller sweep')
+    parser.add_argument('--save-baseline', action = 'store_true', help = 'store this run as the baseline')
+    parser.add_argument('--threshold', type = float, default = 1.2, help = 'ratio to the baseline above which a benchmark counts as slower')
+    parser.add_argument('--history', default = historyPath, help = 'file where every run is appended')
+    parser.add_argument('--baseline', default = baselinePath, help = 'file with the baseline run')
+    options = parser.parse_args(arguments)
+
+    if options.quick:
+        results = runBenchmarks(repeat = 2, sweepDetail = 30)
+    else:
+        results = runBenchmarks()
+    record = benchmarkRecord(results)
+    appendRecord(record, options.history)
+
+    regressions = 0
+    if os.path.isfile(options.baseline):
+        with open(options.baseline) as f:
+            baseline = json.load(f)
+        rows = compareToBaseline(record, baseline, options.threshold)
+        printResults(record, rows)
+        regressions = sum(1 for row in rows if row[4])
+    else:
+        printResults(record)
+    if options.save_baseline:
+        if os.path.dirname(options.baseline) != '' and not os.path.isdir(os.path.dirname(options.baseline)):
+            os.makedirs(os.path.dirname(options.baseline))
+        with open(options.baseline, 'w') as f:
+            json.dump(record, f, indent = 1, sort_keys = True)
+    return 1 if regressions > 0 else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
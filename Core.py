@@ -0,0 +1,498 @@
+#Core of the Initial Allignment Assistant: loading systems and calculating beam states, flags and sweeps
+#Only needs numpy (and Optics.py), so it can be imported by scripts and worker processes without the notebook packages
+#Importing all the definitions form Optics.py
+from Optics import *
+
+#Imports numpy
+import numpy as np
+#Imports parser for ini files
+import configparser
+#Import os to see files and directories
+import os
+#Imports multiprocessing to run sweeps on all cores
+import multiprocessing
+#Imports ast to parse the values of the system files without eval
+import ast
+#Imports threading for the lock of the tracer
+import threading
+#Imports the result store, where big sweeps are written as they are traced
+from ResultStore import createStore, flushStore, openStore
+
+#Returns the names of the systems (the ".ini" files, without the extension) in a directory, in alphabetical order
+def listSystems(directory = 'Systems'):
+    systems = [f[:-4] for f in os.listdir(directory) if f.endswith('.ini') and os.path.isfile(os.path.join(directory, f))]
+    systems.sort()
+    return systems
+
+#Names that can be used in the values of the system files
+literalNames = {'True': True, 'False': False, 'None': None, 'pi': np.pi}
+#Attributes that can be used in the values of the system files, e.g. np.pi
+literalAttributes = {('np', 'pi'): np.pi, ('math', 'pi'): np.pi, ('np', 'e'): np.e, ('math', 'e'): np.e}
+#Operations that can be used in the values of the system files
+literalOperations = {ast.Add: lambda a, b: a + b, ast.Sub: lambda a, b: a - b, ast.Mult: lambda a, b: a*b, ast.Div: lambda a, b: a/b, ast.Pow: lambda a, b: a**b}
+#Largest integers allowed in the values of the system files, in bits, so something like ((9**999)**999)**999 cannot hang the loader
+literalMaxBits = 1024
+
+#Parses a value of a system file: numbers, True/False, pi, lists and arithmetic (+, -, *, /, **) between numbers
+#Anything else (function calls, names, strings, arithmetic on lists, integers above literalMaxBits bits...) raises a ValueError, so a system file cannot run code as it could with eval
+def parseValue(text):
+    try:
+        tree = ast.parse(text.strip(), mode = 'eval')
+    except SyntaxError:
+        raise ValueError("Cannot parse value '" + text + "'")
+    return literalValue(tree.body, text)
+
+#Returns the value of a node of a parsed value, used by parseValue
+def literalValue(node, text):
+    nodeType = type(node).__name__
+    if nodeType == 'Num':
+        return node.n
+    if nodeType == 'Constant' or nodeType == 'NameConstant':
+        if node.value is None or isinstance(node.value, (bool, int, float)):
+            return node.value
+    elif isinstance(node, ast.Name) and node.id in literalNames:
+        return literalNames[node.id]
+    elif isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name) and (node.value.id, node.attr) in literalAttributes:
+        return literalAttributes[(node.value.id, node.attr)]
+    elif isinstance(node, ast.List) or isinstance(node, ast.Tuple):
+        return [literalValue(item, text) for item in node.elts]
+    elif isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+        return -literalNumber(literalValue(node.operand, text), text)
+    elif isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.UAdd):
+        return +literalNumber(literalValue(node.operand, text), text)
+    elif isinstance(node, ast.BinOp) and type(node.op) in literalOperations:
+        left = literalNumber(literalValue(node.left, text), text)
+        right = literalNumber(literalValue(node.right, text), text)
+        #Keeps integer powers like 9**999**999 from being computed at all
+        if isinstance(node.op, ast.Pow) and isinstance(left, int) and isinstance(right, int) and abs(left) > 1 and right*np.log2(abs(left)) > literalMaxBits + 1:
+            raise ValueError("Number too large in value '" + text + "'")
+        try:
+            result = literalOperations[type(node.op)](left, right)
+        except (TypeError, OverflowError, ZeroDivisionError, ValueError):
+            raise ValueError("Cannot calculate value '" + text + "'")
+        return literalNumber(result, text)
+    raise ValueError("Cannot parse value '" + text + "'")
+
+#Returns a value of a parsed value if it is a number that can be used in arithmetic (not a list, None, complex or an integer above literalMaxBits bits), used by literalValue
+def literalNumber(value, text):
+    if not isinstance(value, (int, float)):
+        raise ValueError("Arithmetic only works on numbers in value '" + text + "'")
+    if isinstance(value, int) and value.bit_length() > literalMaxBits:
+        raise ValueError("Number too large in value '" + text + "'")
+    return value
+
+#Fields of the beam in the system files, the required ones and the optional ones with their defaults
+beamFields = (['radiusOfCurvature', 'width', 'direction'], {'position': [0,0,0], 'wavelength': 1064.0E-9, 'indexOfRefraction': 1, 'verbose': False})
+#Classes and fields of each type of element in the system files, the required ones and the optional ones with their defaults (the ID is kept as text)
+elementFields = {
+                 'Mirror': (Mirror, ['radiusOfCurvature', 'positionOfCM', 'parameter_d', 'yaw', 'pitch', 'diameter', 'concave'], {'aperture': False, 'apertureDistance': 0, 'apertureDiameter': 0}),
+                 'Lens': (Lens, ['radiusOfCurvature', 'positionOfCM', 'parameter_d', 'yaw', 'pitch', 'diameter', 'indexOfRefraction', 'convergent'], {}),
+                 'FlatMirror': (FlatMirror, ['positionOfCM', 'parameter_d', 'yaw', 'pitch', 'diameter'], {'aperture': False, 'apertureDistance': 0, 'apertureDiameter': 0}),
+                 'Aperture': (Aperture, ['positionOfCM', 'yaw', 'pitch', 'diameter'], {}),
+                 'WedgePolarizer': (WedgePolarizer, ['positionOfCM', 'yaw', 'pitch', 'diameter', 'angle', 'minimumWidth', 'indexOfRefraction', 'up'], {})
+                }
+
+#Returns the arguments for a beam or element from a section of a system file, a missing required field raises a KeyError as before
+def parseSection(section, required, optional):
+    arguments = {}
+    for name in required:
+        arguments[name] = parseValue(section[name])
+    for name in optional:
+        if name in section:
+            arguments[name] = parseValue(section[name])
+        else:
+            arguments[name] = optional[name]
+    return arguments
+
+#Parses the text of a system file, returns the beam and the list of elements
+def parseSystem(text):
+    config = configparser.ConfigParser()
+    config.read_string(text)
+    beam = Beam(**parseSection(config['Beam'], beamFields[0], beamFields[1]))
+    count = 1
+    elements = []
+    elementNow = 'Element'+'{:02d}'.format(count)
+    while elementNow in config:
+        if config[elementNow]['Type'] in elementFields:
+            elementClass, required, optional = elementFields[config[elementNow]['Type']]
+            elements.append(elementClass(ID = config[elementNow]['ID'], **parseSection(config[elementNow], required, optional)))
+        count = count + 1
+        elementNow = 'Element'+'{:02d}'.format(count)
+    return beam, elements
+
+#Systems already loaded by this process, keyed by path, with the modification time and size of the file they were loaded from
+loadedSystems = {}
+
+#Returns the beam and the compiled OpticalSystem of a system file (shared by all callers, copy them before modifying)
+#Each process parses a file only once, and again when its modification time or size change (useCache = False always parses it)
+#The sweep workers get the compiled system with their tasks, so they never load the files
+def loadSystem(filepath, useCache = True):
+    stat = os.stat(filepath)
+    fileKey = (stat.st_mtime_ns, stat.st_size)
+    path = os.path.abspath(filepath)
+    if useCache and path in loadedSystems and loadedSystems[path][0] == fileKey:
+        return loadedSystems[path][1], loadedSystems[path][2]
+
+    with open(filepath, 'rb') as f:
+        beam, elements = parseSystem(f.read().decode('utf-8'))
+    system = OpticalSystem(elements)
+    if useCache:
+        loadedSystems[path] = (fileKey, beam, system)
+    return beam, system
+
+def beamFromFile(filepath):
+    return loadSystem(filepath)[0].copy()
+
+def elementsFromFile(filepath):
+    beam, system = loadSystem(filepath)
+    elements = system.elements()
+    #Traces the nominal configuration of the system right away, so the plots and sweeps find it ready
+    nominalTrace(beam, elements)
+    return elements
+
+#Nominal traces of the last loaded systems, keyed by the signatures of the beam and elements
+#global nominalTraces
+nominalTraces = {}
+#Maximum number of nominal traces kept
+maxNominalTraces = 8
+
+#Returns the states, flags, beam centers (in the frame of each element) and beam radii of a system with its elements as loaded, tracing it only the first time it is asked for
+#The returned dictionary is shared by all callers and must not be modified
+def nominalTrace(beam, elements):
+    key = (beamSignature(beam), tuple(elementSignature(element) for element in elements))
+    if key in nominalTraces:
+        return nominalTraces[key]
+    beamNow = beam.copy()
+    states = beamNow.calculateStates(elements)
+    trace = {
+             "States": states,
+             "Flags": beamNow.calculateFlags(elements),
+             "BeamCenters": dict((element.ID, rotatePitchYaw(states[element.ID].position - element.positionOfCM, -element.pitch, -element.yaw)[1:]) for element in elements),
+             "BeamRadii": dict((element.ID, states[element.ID].width) for element in elements)
+            }
+    #Forgets the oldest trace when there are too many
+    if len(nominalTraces) >= maxNominalTraces:
+        del nominalTraces[next(iter(nominalTraces))]
+    nominalTraces[key] = trace
+    return trace
+
+#Tracer that remembers the beam states of the last plot, so nudging one element only traces again the elements after it
+#global tracer
+tracer = IncrementalTracer()
+#The tracer and the nominal traces are shared, so the plots of the live mode (on a background thread, see Parameters.py) and the ones of the buttons take turns
+tracerLock = threading.Lock()
+
+def calculatePlotParameters(beam0, elements0, elementView, elementControl, extraYaws, extraPitches):
+    #Makes a copy of the beam
+    beam = beam0.copy()
+    #Makes a copy of all the elements
+    elements = [element.copy() for element in elements0]
+
+    #Shifts the pitch and yaw of all the elements accordingly
+    for i in range(len(elements)):
+        elements[i].pitch = elements[i].pitch + extraPitches[i]
+        elements[i].yaw = elements[i].yaw + extraYaws[i]
+    #Finds the ID os the element that is being controlled (not useful yet, but no harm in it).
+    for iCtrl in range(len(elements)):
+        if elements[iCtrl].ID == elementControl:
+            break
+    #Finds the ID os the element that is being viewed.
+    for iView in range(len(elements)):
+        if elements[iView].ID == elementView:
+            break
+            
+    with tracerLock:
+        #Calculates the states of the beam at each element.
+        states = tracer.calculateStates(beam, elements)
+        #The states of the elements as loaded are traced only once per system
+        nominal = nominalTrace(beam0, elements0)
+        #Calculates the flags for non-intersection and clipping
+        flags = tracer.calculateFlags(beam, elements)
+    
+    #Returns the dictionary with all necessary information for the plot.
+    return {
+            "Title": "View: " + str(elementView) + " | Control: " + str(elementControl),
+            "Range": np.array([-1, 1])*elements[iView].diameter*1.1/2.0,
+            "BeamCenter": rotatePitchYaw(states[elementView].position - elements[iView].positionOfCM, -elements[iView].pitch, -elements[iView].yaw)[1:],
+            "BeamRadius": states[elementView].width,
+            "BeamCenterDefault": nominal["BeamCenters"][elementView],
+            "BeamRadiusDefault": nominal["BeamRadii"][elementView],
+            "Flags": flags            
+           }
+
+#Traces the beam for lists of extra yaws and pitches of every element (shape (count, number of elements)), returns the flag codes of every element and the beam center and radius on the view element
+def traceExtras(beam, system, viewIndex, extraYaws, extraPitches):
+    batch = beam.toBatch(len(extraYaws))
+    flags = batch.calculateFlags(system, extraYaws, extraPitches)
+    state = batch.calculateStates(system, extraYaws, extraPitches)[system.IDs[viewIndex]]
+
+    #Beam center in the frame of the view element (same as "BeamCenter" in calculatePlotParameters)
+    pitch, yaw = system.angles(viewIndex, extraYaws, extraPitches)
+    centers = rotatePitchYawArray(state.position - system.positionOfCM[viewIndex], -pitch, -yaw)[:, 1:]
+    return flags, centers, state.width
+
+#Traces the beam for a list of extra yaws and pitches of one element (the others stay as they are), returns the flag codes of every element and the beam center and radius on the view element
+def tracePoints(beam, system, elementIndex, viewIndex, yaws, pitches):
+    count = len(yaws)
+    extraYaws = np.zeros((count, len(system)))
+    extraPitches = np.zeros((count, len(system)))
+    extraYaws[:, elementIndex] = yaws
+    extraPitches[:, elementIndex] = pitches
+    return traceExtras(beam, system, viewIndex, extraYaws, extraPitches)
+
+#Angles of the elements that can be swept, each axis of a sweep is an (element ID, angle) pair
+sweepAngles = ['yaw', 'pitch']
+
+#Traces one tile of a sweep (a few rows along the first axis of one map, the whole range of the other axes), used by the workers of traceMaps
+def sweepTile(task):
+    beam, system, mapIndex, axes, viewIndex, rowStart, values = task
+    grids = np.meshgrid(*values, indexing = 'ij')
+    #Extra yaws and pitches of every point, an element can be on more than one axis
+    extraAngles = np.zeros((len(sweepAngles), grids[0].size, len(system)))
+    for k in range(len(axes)):
+        extraAngles[axes[k][1], :, axes[k][0]] += grids[k].ravel()
+    flags, centers, widths = traceExtras(beam, system, viewIndex, extraAngles[0], extraAngles[1])
+    shape = grids[0].shape
+    return mapIndex, rowStart, flags.reshape(shape + (len(system),)), centers.reshape(shape + (2,)), widths.reshape(shape)
+
+#Traces the maps of a sweep into flags, beamCenters and beamRadii (arrays or memory maps indexed as [map, first axis, other axes...])
+#maps is a list of (axes, values), the axes as (element index, index in sweepAngles) and the values swept along each of them
+#The maps are split in tiles of about tileSize points that are traced on a pool of processes (all cores by default, processes = 1 runs everything in this process)
+def traceMaps(beam, system, viewIndex, maps, flags, beamCenters, beamRadii, tileSize = 20000, processes = None):
+    tasks = []
+    for i in range(len(maps)):
+        axes, values = maps[i]
+        #Each tile holds a few full rows along the first axis
+        rowsPerTile = max(1, int(tileSize/int(np.prod([len(value) for value in values[1:]]))))
+        for rowStart in range(0, len(values[0]), rowsPerTile):
+            tasks.append((beam, system, i, axes, viewIndex, rowStart, [values[0][rowStart:rowStart + rowsPerTile]] + list(values[1:])))
+
+    def storeTiles(results):
+        for i, rowStart, flagsTile, centersTile, radiiTile in results:
+            rows = slice(rowStart, rowStart + len(flagsTile))
+            flags[i, rows] = flagsTile
+            beamCenters[i, rows] = centersTile
+            beamRadii[i, rows] = radiiTile
+
+    if processes == 1:
+        storeTiles(map(sweepTile, tasks))
+    else:
+        #The workers are closed and joined when the sweep finishes, and terminated if it fails
+        with multiprocessing.Pool(processes) as pool:
+            storeTiles(pool.imap_unordered(sweepTile, tasks))
+            pool.close()
+            pool.join()
+
+#Returns the index of the element ID in elementsIDs, or raises a ValueError naming the system (when given) and its elements
+def indexOfElement(elementsIDs, ID, system = None):
+    elementsIDs = list(elementsIDs)
+    if ID not in elementsIDs:
+        raise ValueError("No element " + str(ID) + ("" if system is None else " in " + system) + ", the elements are " + ", ".join(str(elementID) for elementID in elementsIDs))
+    return elementsIDs.index(ID)
+
+#Returns the beam, nominal trace, compiled system, IDs of the elements, ID and index of the view element (last element by default) of a system file for a sweep
+def sweepSystem(system, viewID = None):
+    beam = beamFromFile('Systems/' + system)
+    elements = elementsFromFile('Systems/' + system)
+    nominal = nominalTrace(beam, elements)
+    #The compiled system is what gets sent to the workers
+    opticalSystem = OpticalSystem(elements)
+    elementsIDs = list(opticalSystem.IDs)
+    if viewID is None:
+        viewID = elementsIDs[-1]
+    return beam, nominal, opticalSystem, elementsIDs, viewID, indexOfElement(elementsIDs, viewID, system)
+
+#Returns the arrays where a sweep of the given shape is traced, in memory, or in a result store file at path with the other arrays ({name: value}) and the metadata
+def sweepOutputs(path, shape, elementCount, arrays, metadata):
+    if path is None:
+        return {"Flags": np.zeros(shape + (elementCount,), dtype = np.uint8), "BeamCenters": np.zeros(shape + (2,)), "BeamRadii": np.zeros(shape)}
+    layout = {"Flags": (shape + (elementCount,), np.uint8), "BeamCenters": (shape + (2,), float), "BeamRadii": (shape, float)}
+    for name in arrays:
+        layout[name] = (np.shape(arrays[name]), float)
+    store = createStore(path, layout, metadata = metadata)
+    for name in arrays:
+        store[name][...] = arrays[name]
+    return store
+
+#Sweeps the yaw and pitch of each movable element of a system over its range (one [[yawMin, yawMax], [pitchMin, pitchMax]] per movable element), with detail points per axis
+#The grids are split in tiles of about tileSize points that are traced on a pool of processes (all cores by default, processes = 1 runs everything in this process)
+#Returns a dictionary of dense arrays, indexed as [movable element, yaw, pitch], with the flag codes of every element (see BeamBatch.calculateFlags) and the beam center and radius on the view element (last element by default), along with the nominal beam center and radius on it
+#If path is given the arrays are written tile by tile into a result store file there (see ResultStore.py) instead of being kept in memory, and the returned dictionary is the store opened for reading
+def sweepAlignmentMap(system, movableIDs, ranges, detail, viewID = None, tileSize = 20000, processes = None, path = None):
+    beam, nominal, opticalSystem, elementsIDs, viewID, viewIndex = sweepSystem(system, viewID)
+    yaws = np.array([np.linspace(ran[0][0], ran[0][1], num = detail) for ran in ranges])
+    pitches = np.array([np.linspace(ran[1][0], ran[1][1], num = detail) for ran in ranges])
+    maps = []
+    for i in range(len(movableIDs)):
+        elementIndex = indexOfElement(elementsIDs, movableIDs[i], system)
+        maps.append(([(elementIndex, 0), (elementIndex, 1)], [yaws[i], pitches[i]]))
+
+    outputs = sweepOutputs(path, (len(movableIDs), detail, detail), len(elementsIDs), {"Yaws": yaws, "Pitches": pitches, "BeamCenterDefault": nominal["BeamCenters"][viewID]},
+                           {"ElementsIDs": elementsIDs, "MovableIDs": list(movableIDs), "ViewID": viewID, "BeamRadiusDefault": float(nominal["BeamRadii"][viewID])})
+    traceMaps(beam, opticalSystem, viewIndex, maps, outputs["Flags"], outputs["BeamCenters"], outputs["BeamRadii"], tileSize = tileSize, processes = processes)
+
+    if path is not None:
+        flushStore(outputs)
+        del outputs
+        return openStore(path)
+    return {
+            "ElementsIDs": elementsIDs,
+            "MovableIDs": list(movableIDs),
+            "ViewID": viewID,
+            "Yaws": yaws,
+            "Pitches": pitches,
+            "Flags": outputs["Flags"],
+            "BeamCenters": outputs["BeamCenters"],
+            "BeamRadii": outputs["BeamRadii"],
+            "BeamCenterDefault": nominal["BeamCenters"][viewID],
+            "BeamRadiusDefault": nominal["BeamRadii"][viewID]
+           }
+
+#Sweeps any angles of any elements of a system at once, axes is a list of (element ID, 'yaw' or 'pitch') pairs with one [min, max] range per axis, and detail points per axis
+#e.g. sweepMap(system, [('PR2', 'yaw'), ('PR3', 'pitch')], [[-5e-3, 5e-3], [-5e-3, 5e-3]], 1000) for the map of the yaw of PR2 against the pitch of PR3
+#Returns a dictionary like the one of sweepAlignmentMap for a single map, with the values of each axis in "Values" and the arrays indexed as [first axis, second axis, ...]
+#Traced on a pool of processes and written to a result store at path (if given) the same way as sweepAlignmentMap
+def sweepMap(system, axes, ranges, detail, viewID = None, tileSize = 20000, processes = None, path = None):
+    beam, nominal, opticalSystem, elementsIDs, viewID, viewIndex = sweepSystem(system, viewID)
+    axisIndices = []
+    for ID, angle in axes:
+        elementIndex = indexOfElement(elementsIDs, ID, system)
+        if angle not in sweepAngles:
+            raise ValueError("Cannot sweep '" + str(angle) + "', the axes are 'yaw' or 'pitch'")
+        axisIndices.append((elementIndex, sweepAngles.index(angle)))
+    if len(ranges) != len(axes):
+        raise ValueError("Give one range per axis (" + str(len(axes)) + ")")
+    values = np.array([np.linspace(ran[0], ran[1], num = detail) for ran in ranges])
+
+    outputs = sweepOutputs(path, (detail,)*len(axes), len(elementsIDs), {"Values": values, "BeamCenterDefault": nominal["BeamCenters"][viewID]},
+                           {"ElementsIDs": elementsIDs, "Axes": [[ID, angle] for ID, angle in axes], "ViewID": viewID, "BeamRadiusDefault": float(nominal["BeamRadii"][viewID])})
+    #The map is traced as the only map of traceMaps
+    traceMaps(beam, opticalSystem, viewIndex, [(axisIndices, list(values))], outputs["Flags"][np.newaxis], outputs["BeamCenters"][np.newaxis], outputs["BeamRadii"][np.newaxis], tileSize = tileSize, processes = processes)
+
+    if path is not None:
+        flushStore(outputs)
+        del outputs
+        return openStore(path)
+    return {
+            "ElementsIDs": elementsIDs,
+            "Axes": [[ID, angle] for ID, angle in axes],
+            "ViewID": viewID,
+            "Values": values,
+            "Flags": outputs["Flags"],
+            "BeamCenters": outputs["BeamCenters"],
+            "BeamRadii": outputs["BeamRadii"],
+            "BeamCenterDefault": nominal["BeamCenters"][viewID],
+            "BeamRadiusDefault": nominal["BeamRadii"][viewID]
+           }
+
+#Sweeps the yaw and pitch of one movable element over its range [[yawMin, yawMax], [pitchMin, pitchMax]] refining only where it matters, as a quadtree
+#Starts with a grid of 2**initialDepth cells per axis, and splits the cells whose probe points disagree in their flag codes, or whose beam centers on the view element (last element by default) are further apart than centerThreshold (if given), down to 2**maxDepth cells per axis
+#The probe points of a cell are its corners and a sub-lattice of 2**probeDepth intervals per side (probeDepth = 1 adds the center and the midpoints of the edges)
+#The probe points are points of a lattice of 2**maxDepth + 1 points per axis, each one traced only once, and each level of the tree is traced in BeamBatches of at most tileSize points
+#A region of flags that falls between the probe points of a cell is still missed, raise probeDepth (or initialDepth) if thin features matter
+#The map saves traces only when the flag boundaries are short: on HAM2 with IM1 over its findRanges range and maxDepth = 8 it traces 37235 of the 66049 points with probeDepth = 1 (2 pixels differ from sweepAlignmentMap at 257), and 25225 with probeDepth = 0 (108 pixels differ)
+#Returns a dictionary with the traced points (lattice coordinates, flag codes, beam centers and radii) and the leaves of the tree, see rasterizeAdaptiveMap to turn it into a grid
+def adaptiveAlignmentMap(system, movableID, ranges, maxDepth = 8, initialDepth = 3, centerThreshold = None, viewID = None, tileSize = 20000, probeDepth = 1):
+    beam, nominal, opticalSystem, elementsIDs, viewID, viewIndex = sweepSystem(system, viewID)
+    elementIndex = indexOfElement(elementsIDs, movableID, system)
+    size = 2**maxDepth
+
+    #Index of each traced lattice point in the lists below
+    pointIndex = {}
+    points = []
+    flags = []
+    centers = []
+    radii = []
+
+    #Traces the lattice points that were not traced yet
+    def tracePointsOnce(newPoints):
+        newPoints = [point for point in dict.fromkeys(newPoints) if point not in pointIndex]
+        for start in range(0, len(newPoints), tileSize):
+            tile = np.array(newPoints[start:start + tileSize], dtype = float)
+            yaws = ranges[0][0] + (ranges[0][1] - ranges[0][0])*tile[:, 0]/size
+            pitches = ranges[1][0] + (ranges[1][1] - ranges[1][0])*tile[:, 1]/size
+            flagsTile, centersTile, radiiTile = tracePoints(beam, opticalSystem, elementIndex, viewIndex, yaws, pitches)
+            for k in range(len(tile)):
+                pointIndex[newPoints[start + k]] = len(points)
+                points.append(newPoints[start + k])
+            flags.append(flagsTile)
+            centers.append(centersTile)
+            radii.append(radiiTile)
+
+    #Corners of a cell (i, j, cell size), in the order (0,0), (1,0), (0,1), (1,1)
+    def corners(cell):
+        i, j, step = cell
+        return [(i, j), (i + step, j), (i, j + step), (i + step, j + step)]
+
+    #Points of a cell checked before deciding it is a leaf: the corners and a sub-lattice of 2**probeDepth intervals per side (clipped to the lattice)
+    def probes(cell):
+        i, j, step = cell
+        spacing = max(step//2**probeDepth, 1)
+        return [(i + k, j + l) for k in range(0, step + 1, spacing) for l in range(0, step + 1, spacing)]
+
+    step = size//2**initialDepth
+    cells = [(i, j, step) for i in range(0, size, step) for j in range(0, size, step)]
+    leaves = []
+    while len(cells) > 0:
+        tracePointsOnce([point for cell in cells for point in probes(cell)])
+        allFlags = np.concatenate(flags)
+        allCenters = np.concatenate(centers)
+        split = []
+        for cell in cells:
+            indices = [pointIndex[point] for point in probes(cell)]
+            cellFlags = allFlags[indices]
+            refine = bool(np.any(cellFlags != cellFlags[0]))
+            if not refine and centerThreshold is not None:
+                cellCenters = allCenters[indices]
+                refine = bool(np.ptp(cellCenters, axis = 0).max() > centerThreshold)
+            if refine and cell[2] > 1:
+                half = cell[2]//2
+                i, j = cell[0], cell[1]
+                split += [(i, j, half), (i + half, j, half), (i, j + half, half), (i + half, j + half, half)]
+            else:
+                leaves.append(cell)
+        cells = split
+
+    return {
+            "ElementsIDs": elementsIDs,
+            "MovableID": movableID,
+            "ViewID": viewID,
+            "Ranges": ranges,
+            "LatticeSize": size,
+            "Points": np.array(points, dtype = int),
+            "Flags": np.concatenate(flags),
+            "BeamCenters": np.concatenate(centers),
+            "BeamRadii": np.concatenate(radii),
+            "Leaves": np.array(leaves, dtype = int),
+            "LeafCorners": np.array([[pointIndex[corner] for corner in corners(leaf)] for leaf in leaves], dtype = int)
+           }
+
+#Turns the quadtree of adaptiveAlignmentMap into dense arrays of detail points per axis, indexed as [yaw, pitch] like sweepAlignmentMap
+#Every point takes the values of the closest corner of the leaf it falls in
+def rasterizeAdaptiveMap(adaptiveMap, detail):
+    size = adaptiveMap["LatticeSize"]
+    #Position of the points of the grid in lattice coordinates
+    lattice = np.linspace(0, size, num = detail)
+    leafIndex = np.zeros((detail, detail), dtype = int)
+    for k in range(len(adaptiveMap["Leaves"])):
+        i, j, step = adaptiveMap["Leaves"][k]
+        rows = slice(np.searchsorted(lattice, i), np.searchsorted(lattice, i + step, side = 'right'))
+        columns = slice(np.searchsorted(lattice, j), np.searchsorted(lattice, j + step, side = 'right'))
+        leafIndex[rows, columns] = k
+
+    leaves = adaptiveMap["Leaves"][leafIndex]
+    cornerX = np.rint((lattice[:, np.newaxis] - leaves[:, :, 0])/leaves[:, :, 2]).astype(int)
+    cornerY = np.rint((lattice[np.newaxis, :] - leaves[:, :, 1])/leaves[:, :, 2]).astype(int)
+    points = adaptiveMap["LeafCorners"][leafIndex, cornerX + 2*cornerY]
+
+    ranges = adaptiveMap["Ranges"]
+    return {
+            "ElementsIDs": adaptiveMap["ElementsIDs"],
+            "MovableID": adaptiveMap["MovableID"],
+            "ViewID": adaptiveMap["ViewID"],
+            "Yaws": np.linspace(ranges[0][0], ranges[0][1], num = detail),
+            "Pitches": np.linspace(ranges[1][0], ranges[1][1], num = detail),
+            "Flags": adaptiveMap["Flags"][points],
+            "BeamCenters": adaptiveMap["BeamCenters"][points],
+            "BeamRadii": adaptiveMap["BeamRadii"][points]
+           }
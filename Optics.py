@@ -1,4 +1,5 @@
 import numpy as np
+import math
 
 #Returns the norm/magnitude of a N-Dimensional input vector in cartesian coordinates
 def norm(vector):
@@ -35,21 +36,62 @@ def angleBetweenVectors(vector1, vector2):
 def criticalAngle(indexOfRefraction):
     return arcsin(1.0/indexOfRefraction)
 
+#Returns the rotation matrix for a pitch (polar rotation) and a yaw (azymuthal rotation), it takes (1,0,0), or any vector with an azymuthal angle of 0, to the vector with its polar angle increased by pitch and azymuthal angle increased by yaw
+#Works for single angles (3x3 matrix) and for arrays of angles (array of matrices of shape (..., 3, 3))
+def pitchYawMatrix(pitch, yaw):
+    pitch, yaw = np.broadcast_arrays(np.asarray(pitch, dtype = float), np.asarray(yaw, dtype = float))
+    cp = np.cos(pitch)
+    sp = np.sin(pitch)
+    cy = np.cos(yaw)
+    sy = np.sin(yaw)
+    matrix = np.zeros(pitch.shape + (3, 3))
+    matrix[..., 0, 0] = cy*cp
+    matrix[..., 0, 1] = -sy
+    matrix[..., 0, 2] = -cy*sp
+    matrix[..., 1, 0] = sy*cp
+    matrix[..., 1, 1] = cy
+    matrix[..., 1, 2] = -sy*sp
+    matrix[..., 2, 0] = sp
+    matrix[..., 2, 2] = cp
+    return matrix
+
+#Returns the unit vector with a polar angle of pitch and an azymuthal angle of yaw, the same as rotatePitchYaw([1,0,0], pitch, yaw) (first column of pitchYawMatrix), works for arrays of angles
+def pitchYawDirection(pitch, yaw):
+    if isinstance(pitch, (int, float)) and isinstance(yaw, (int, float)):
+        cp = math.cos(pitch)
+        return np.array([cp*math.cos(yaw), cp*math.sin(yaw), math.sin(pitch)])
+    pitch, yaw = np.broadcast_arrays(np.asarray(pitch, dtype = float), np.asarray(yaw, dtype = float))
+    cp = np.cos(pitch)
+    return np.stack([cp*np.cos(yaw), cp*np.sin(yaw), np.sin(pitch)], axis = -1)
+
 #Changes a vector's "Yaw" by changing its azymuthal angle, returns a rotated version of the vector
 def rotateYaw(vector, yaw):
-    vectorSph = toSpherical(vector)
-    vectorSph[2] = vectorSph[2] + yaw
-    return toCartesian(vectorSph)
+    return rotatePitchYaw(vector, 0.0, yaw)
 
 #Changes a vector's "Pitch" by changing its polar angle, returns a rotated version of the vector
 def rotatePitch(vector, pitch):
-    vectorSph = toSpherical(vector)
-    vectorSph[1] = vectorSph[1] + pitch
-    return toCartesian(vectorSph)
+    return rotatePitchYaw(vector, pitch, 0.0)
 
 #Changes a vector pitch and yaw by changing its polar and azymuthal angles, the order does no matter
+#Closed form of the round trip through toSpherical/toCartesian: pitchYawMatrix applied in the frame where the vector has an azymuthal angle of 0
 def rotatePitchYaw(vector, pitch, yaw):
-    return rotatePitch(rotateYaw(vector, yaw), pitch)
+    x = vector[0]
+    y = vector[1]
+    z = vector[2]
+    rho = math.sqrt(x*x + y*y)
+    #Cosine and sine of the azymuthal angle of the vector (toSpherical gives 0 for vectors along z)
+    if rho > 0:
+        c = x/rho
+        s = y/rho
+    else:
+        c = 1.0
+        s = 0.0
+    cp = math.cos(pitch)
+    sp = math.sin(pitch)
+    cy = math.cos(yaw)
+    sy = math.sin(yaw)
+    a = rho*cp - z*sp
+    return np.array([a*(c*cy - s*sy), a*(s*cy + c*sy), rho*sp + z*cp])
 
 #Returns True of False if the beam will eventually collide with the optical element
 #This works for both lenses and mirrors    
@@ -106,54 +148,177 @@ def intersectionBetweenLineAndPlane(directionOfLine, pointInLine, pointInPlane,
     else:
         intersection = None
     return intersection
-        
-#Class used for the propagation of a Gaussian Beam    
+
+#Returns the dot product between arrays of vectors along the last axis (arrays broadcast against each other)
+def dotArray(vectors1, vectors2):
+    return np.einsum('...i,...i->...', vectors1, vectors2)
+
+#Returns the norms of an array of vectors in cartesian coordinates (one norm per vector along the last axis)
+def normArray(vectors):
+    v = np.asarray(vectors, dtype = float)
+    return np.sqrt(dotArray(v, v))
+
+#Returns a normalized version of an array of vectors in cartesian coordinates
+def normalizeArray(vectors):
+    v = np.asarray(vectors, dtype = float)
+    return v/normArray(v)[..., np.newaxis]
+
+#Array version of rotatePitchYaw, rotates one or many vectors by one or many pitches and yaws (arrays broadcast against each other), same conventions as rotatePitchYaw
+def rotatePitchYawArray(vectors, pitch, yaw):
+    v = np.asarray(vectors, dtype = float)
+    rho = np.sqrt(v[..., 0]**2 + v[..., 1]**2)
+    safeRho = np.where(rho > 0, rho, 1.0)
+    c = np.where(rho > 0, v[..., 0]/safeRho, 1.0)
+    s = np.where(rho > 0, v[..., 1]/safeRho, 0.0)
+    #Rotates the vectors as they would be with an azymuthal angle of 0, (rho, 0, z), then rotates them back by their azymuthal angles
+    matrix = pitchYawMatrix(pitch, yaw)
+    local = matrix[..., :, 0]*rho[..., np.newaxis] + matrix[..., :, 2]*v[..., 2, np.newaxis]
+    return np.stack([c*local[..., 0] - s*local[..., 1], s*local[..., 0] + c*local[..., 1], local[..., 2]], axis = -1)
+
+#Array version of intersectionBetweenLineAndPlane, returns the intersections and a boolean array that is False where the scalar version would return None
+def intersectionBetweenLinesAndPlane(directionsOfLines, pointsInLines, pointInPlane, normalOfPlane):
+    p = pointInPlane
+    n = normalOfPlane
+    l = directionsOfLines
+    o = pointsInLines
+    ln = dotArray(l, n)
+    pn = dotArray(p - o, n)
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        d = np.where(ln != 0, pn/np.where(ln != 0, ln, 1.0), 0.0)
+    valid = (ln != 0) | (pn == 0)
+    intersections = np.where(valid[..., np.newaxis], o + d[..., np.newaxis]*l, np.nan)
+    return intersections, valid
+
+#Array version of intersectionsBetweenLineAndSphere, returns both intersections and a boolean array that is False where the scalar version would return None
+def intersectionsBetweenLinesAndSphere(directionsOfLines, pointsInLines, centerOfSphere, radiusOfSphere):
+    l = directionsOfLines
+    o = pointsInLines
+    c = centerOfSphere
+    r = radiusOfSphere
+    b = dotArray(l, o - c)
+    discriminant = b**2 - (normArray(o - c)**2 - r**2)
+    valid = discriminant > 0
+    root = np.sqrt(np.where(valid, discriminant, 0.0))
+    intersection1 = o + (-b + root)[..., np.newaxis]*l
+    intersection2 = o + (-b - root)[..., np.newaxis]*l
+    intersection1 = np.where(valid[..., np.newaxis], intersection1, np.nan)
+    intersection2 = np.where(valid[..., np.newaxis], intersection2, np.nan)
+    return intersection1, intersection2, valid
+
+#Array version of intersectionBetweenLineAndSphere, returns the intersection closest to the vertex and a boolean array that is False where the scalar version would return None
+def intersectionBetweenLinesAndSphere(directionsOfLines, pointsInLines, centerOfSphere, radiusOfSphere, vertex):
+    intersection1, intersection2, valid = intersectionsBetweenLinesAndSphere(directionsOfLines, pointsInLines, centerOfSphere, radiusOfSphere)
+    closest1 = normArray(intersection1 - vertex) < normArray(intersection2 - vertex)
+    return np.where(closest1[..., np.newaxis], intersection1, intersection2), valid
+
+#Returns the parameter q such that 1/q = 1/r - i*lambda/(pi*n*w^2), works for numbers and arrays
+def qFromRadiusAndWidth(radiusOfCurvature, width, wavelength, indexOfRefraction):
+    with np.errstate(divide = 'ignore'):
+        return 1.0/(1.0/np.asarray(radiusOfCurvature, dtype = float) - 1.0j*wavelength/(np.pi*indexOfRefraction*np.asarray(width, dtype = float)**2.0))[()]
+
+#Returns the radius of curvature for a given q (infinite for a flat wavefront)
+def radiusFromQ(q):
+    with np.errstate(divide = 'ignore'):
+        return 1.0/np.real(1.0/np.asarray(q))[()]
+
+#Returns the width for a given q
+def widthFromQ(q, wavelength, indexOfRefraction):
+    return ((np.imag(1.0/np.asarray(q)))*(-np.pi*indexOfRefraction/wavelength))**(-0.5)
+
+#Applies an ABCD matrix, given as (A, B, C, D), to q: q' = (A*q + B)/(C*q + D)
+#The entries can be numbers or arrays (one per beam), so the same matrices act on Beam and BeamBatch
+def abcdTransform(q, matrix):
+    A, B, C, D = matrix
+    return (A*q + B)/(C*q + D)
+
+#ABCD matrix of the propagation over a distance
+def propagationMatrix(distance):
+    return (1.0, distance, 0.0, 1.0)
+
+#ABCD matrix of a thin focusing element of the given power (1/f): 2/R for a concave mirror, -2/R for a convex one and (n2 - n1)/R for a curved surface between two media
+def focusingMatrix(power):
+    return (1.0, 0.0, -power, 1.0)
+
+#Returns q after the beam goes into a medium with another index of refraction, keeping its radius of curvature and width
+def changeIndexOfRefraction(q, indexOfRefraction, newIndexOfRefraction):
+    inverse = 1.0/q
+    return 1.0/(np.real(inverse) + 1.0j*np.imag(inverse)*indexOfRefraction/newIndexOfRefraction)
+
+#Class used for the propagation of a Gaussian Beam
 class Beam:
+    #Kept from the system files (verbose = ...) for compatibility, the beam does not print anything, use TraceLog.py to record its propagations and interactions
+    verbose = False
+
     #Initialization of the class    
-    def __init__(self, radiusOfCurvature, width, direction, position = [0,0,0], wavelength = 1064.0E-9, indexOfRefraction = 1, verbose = True):
-        #Current radius of curvature of the beam
-        self.radiusOfCurvature = radiusOfCurvature
-        #Initial width (sigma) of the beam
-        self.width = width
+    def __init__(self, radiusOfCurvature, width, direction, position = [0,0,0], wavelength = 1064.0E-9, indexOfRefraction = 1, verbose = False):
         #Wavelength of the beam
         self.wavelength = wavelength
         #Index of refraction of the medium
         self.indexOfRefraction = indexOfRefraction
+        #Parameter q of the beam, which carries its radius of curvature and width (see radiusOfCurvature and width)
+        self.qParameter = qFromRadiusAndWidth(radiusOfCurvature, width, wavelength, indexOfRefraction)
         #Current position of the beam (given as an array or a np.array of 3 values, [x,y,z]), code converts to a np.array
         self.position = np.array(position)
         #Current direction of the beam (given as an arrat or a np.array of 3 values[x,y,z]), code converts to a np.arrat and normalizes it. (essentially k-vector)
         self.direction = normalize(direction)
-        #Toggles diologs when interactions happens
+        #Kept for compatibility only (see verbose above), copies of the beam do not carry it
         self.verbose = verbose
     #Returns the parameter q such that 1/q = 1/r - i*lambda/(pi*n*w^2)
     def q(self):
-        #numpy used j as the imaginary unit
-        return 1.0/(1.0/self.radiusOfCurvature - 1.0j*self.wavelength/(np.pi*self.indexOfRefraction*self.width**2.0))
+        return self.qParameter
+
+    #Current radius of curvature of the beam, calculated from q only when asked for (assigning it keeps the width)
+    @property
+    def radiusOfCurvature(self):
+        return radiusFromQ(self.qParameter)
+
+    @radiusOfCurvature.setter
+    def radiusOfCurvature(self, radiusOfCurvature):
+        self.qParameter = qFromRadiusAndWidth(radiusOfCurvature, self.width, self.wavelength, self.indexOfRefraction)
+
+    #Current width (sigma) of the beam, calculated from q only when asked for (assigning it keeps the radius of curvature)
+    @property
+    def width(self):
+        return widthFromQ(self.qParameter, self.wavelength, self.indexOfRefraction)
+
+    @width.setter
+    def width(self, width):
+        self.qParameter = qFromRadiusAndWidth(self.radiusOfCurvature, width, self.wavelength, self.indexOfRefraction)
 
     #Returns the radius of curvature form a given q    
     def radiusFrom_q(self,q):
-        return ((q**(-1.0)).real)**(-1.0)
+        return radiusFromQ(q)
     #Returns the width form a given q
     def widthFrom_q(self,q):
-        return (((q**(-1.0)).imag)*(-np.pi*self.indexOfRefraction/self.wavelength))**(-0.5)
+        return widthFromQ(q, self.wavelength, self.indexOfRefraction)
+
+    #Changes the index of refraction of the medium, keeping the radius of curvature and width
+    def setIndexOfRefraction(self, indexOfRefraction):
+        self.qParameter = changeIndexOfRefraction(self.qParameter, self.indexOfRefraction, indexOfRefraction)
+        self.indexOfRefraction = indexOfRefraction
   
     #Returns a copy of the beam state as it is when the function is called    
     def copy(self):
-        return Beam(radiusOfCurvature = self.radiusOfCurvature, width = self.width, direction = self.direction, position = self.position, wavelength = self.wavelength, indexOfRefraction = self.indexOfRefraction, verbose = self.verbose)
+        beam = Beam.__new__(Beam)
+        beam.wavelength = self.wavelength
+        beam.indexOfRefraction = self.indexOfRefraction
+        beam.qParameter = self.qParameter
+        beam.position = np.array(self.position)
+        beam.direction = np.array(self.direction)
+        return beam
+
+    #Returns a BeamBatch holding count identical copies of the beam state as it is when the function is called
+    def toBatch(self, count):
+        batch = BeamBatch(radiusOfCurvature = np.full(count, self.radiusOfCurvature, dtype = float), width = np.full(count, self.width, dtype = float), direction = np.tile(self.direction, (count, 1)), position = np.tile(self.position, (count, 1)), wavelength = self.wavelength, indexOfRefraction = np.full(count, self.indexOfRefraction, dtype = float))
+        batch.qParameter = np.full(count, self.qParameter, dtype = complex)
+        return batch
     
     #Propagates the beam for a given distance. Will update the value of the radius of cruvature, width, and position. It will propagate the beam in the direction that it has. Does not return anything
     def propagate(self, distance):
-        if self.verbose: 
-            print("Propagating a distance of " + str(distance))
-        q = self.q()
-        q = q + distance
-        self.radiusOfCurvature = self.radiusFrom_q(q)
-        self.width = self.widthFrom_q(q)
+        self.qParameter = abcdTransform(self.qParameter, propagationMatrix(distance))
         
         self.position = self.position + distance*self.direction
-        
-        
-        
+    
     #Changes the direction of the beam after reflecting on a plane perpendicular to the normal being inputed
     def reflect(self, normal):
         self.direction = self.direction - 2*(self.direction.dot(normal))*normal
@@ -166,12 +331,9 @@ class Beam:
             normal = normalize(element.center1() - self.position)
             thI = angleBetweenVectors(-1*self.direction, normal)
             self.direction = normalize(k*self.direction + (k*np.cos(thI)-np.sqrt(1.0-(k**2)*(1.0-np.cos(thI)**2.0)))*normal)
-            self.indexOfRefraction = n2
-            q = self.q()
-            q = 1.0/(1.0/q - (n2-n1)/abs(element.radiusOfCurvature))
-            self.radiusOfCurvature = self.radiusFrom_q(q)
-            self.width = self.widthFrom_q(q)
-            distanceToOtherSide = norm(self.position - intersectionBetweenLineAndSphere(self.direction, self.position, element.center2(), abs(element.radiusOfCurvature)), element.vertex1())
+            self.setIndexOfRefraction(n2)
+            self.qParameter = abcdTransform(self.qParameter, focusingMatrix((n2-n1)/abs(element.radiusOfCurvature)))
+            distanceToOtherSide = norm(self.position - intersectionBetweenLineAndSphere(self.direction, self.position, element.center2(), abs(element.radiusOfCurvature), element.vertex1()))
             self.propagate(distanceToOtherSide)
             n1 = 1.0*element.indexOfRefraction
             n2 = 1.0
@@ -179,11 +341,8 @@ class Beam:
             normal = -normalize(element.center2() - self.position)
             thI = angleBetweenVectors(-1*self.direction, normal)
             self.direction = normalize(k*self.direction + (k*np.cos(thI)-np.sqrt(1.0-(k**2)*(1.0-np.cos(thI)**2.0)))*normal)
-            self.indexOfRefraction = n2
-            q = self.q()
-            q = 1.0/(1.0/q - (n2-n1)/abs(element.radiusOfCurvature))
-            self.radiusOfCurvature = self.radiusFrom_q(q)
-            self.width = self.widthFrom_q(q)
+            self.setIndexOfRefraction(n2)
+            self.qParameter = abcdTransform(self.qParameter, focusingMatrix((n2-n1)/abs(element.radiusOfCurvature)))
         elif isinstance(element, ThinLens):
             pass
         elif isinstance(element, WedgePolarizer):
@@ -193,7 +352,7 @@ class Beam:
             normal = element.normal1()
             thI = angleBetweenVectors(-1*self.direction, normal)
             self.direction = normalize(k*self.direction + (k*np.cos(thI)-np.sqrt(1.0-(k**2)*(1.0-np.cos(thI)**2.0)))*normal)
-            self.indexOfRefraction = n2
+            self.setIndexOfRefraction(n2)
             distanceToOtherSide = norm(self.position - intersectionBetweenLineAndPlane(self.direction, self.position, element.vertex2(), element.normal2()))
             self.propagate(distanceToOtherSide)
             n1 = element.indexOfRefraction
@@ -202,7 +361,7 @@ class Beam:
             normal = -element.normal2()
             thI = angleBetweenVectors(-1*self.direction, normal)
             self.direction = normalize(k*self.direction + (k*np.cos(thI)-np.sqrt(1.0-(k**2)*(1.0-np.cos(thI)**2.0)))*normal)
-            self.indexOfRefraction = 1.0
+            self.setIndexOfRefraction(1.0)
             
             
         
@@ -221,13 +380,15 @@ class Beam:
             #Intersection function will return None if there is no internsection
         elif isinstance(element, Lens):
             intersections = intersectionsBetweenLineAndSphere(self.direction, self.position, element.center1(), element.radiusOfCurvature)
-            if element.convergent:
-                if self.direction.dot(element.center1 - intersections[0]) > 0:
+            if intersections is None:
+                intersection = None
+            elif element.convergent:
+                if self.direction.dot(element.center1() - intersections[0]) > 0:
                     intersection = intersections[0]
                 else:
                     intersection = intersections[1]
             else:
-                if self.direction.dot(element.center1 - intersections[0]) < 0:
+                if self.direction.dot(element.center1() - intersections[0]) < 0:
                     intersection = intersections[0]
                 else:
                     intersection = intersections[1]
@@ -263,13 +424,15 @@ class Beam:
             #Intersection function will return None if there is no internsection
         elif isinstance(element, Lens):
             intersections = intersectionsBetweenLineAndSphere(self.direction, self.position, element.center1(), element.radiusOfCurvature)
-            if element.convergent:
-                if self.direction.dot(element.center1 - intersections[0]) > 0:
+            if intersections is None:
+                intersection = None
+            elif element.convergent:
+                if self.direction.dot(element.center1() - intersections[0]) > 0:
                     intersection = intersections[0]
                 else:
                     intersection = intersections[1]
             else:
-                if self.direction.dot(element.center1 - intersections[0]) < 0:
+                if self.direction.dot(element.center1() - intersections[0]) < 0:
                     intersection = intersections[0]
                 else:
                     intersection = intersections[1]
@@ -297,13 +460,10 @@ class Beam:
             if isinstance(element, Mirror):
                 normalToCollisionPoint = normalize(element.center1() - self.position)
                 self.reflect(normalToCollisionPoint)
-                q = self.q()
                 if element.concave:
-                    q = 1.0/(1.0/q - 2.0/element.radiusOfCurvature)
+                    self.qParameter = abcdTransform(self.qParameter, focusingMatrix(2.0/element.radiusOfCurvature))
                 else:
-                    q = 1.0/(1.0/q + 2.0/element.radiusOfCurvature)
-                self.radiusOfCurvature = self.radiusFrom_q(q)
-                self.width = self.widthFrom_q(q)
+                    self.qParameter = abcdTransform(self.qParameter, focusingMatrix(-2.0/element.radiusOfCurvature))
             elif isinstance(element, Lens) or isinstance(element, WedgePolarizer):
                 self.refract(element)
             elif isinstance(element, FlatMirror):
@@ -313,24 +473,105 @@ class Beam:
             elif isinstance(element, Aperture):
                 pass;
         else:
-            if self.verbose: print("Cannot interact with element " + str(element.ID) + ", no collision detected!")
             if isinstance(element, Mirror) or isinstance(element, FlatMirror) or isinstance(element, WedgePolarizer):
                 self.interact(InfinitePlane(element.ID, element.vertex1(), element.yaw, element.pitch))
                 
+    #Returns the states of the beam (as Beam objects) every step along its path through the elements, plus 30 steps after the last one
     def track(self, elements, step):
         beam = self.copy()
-        beamStates = np.array([beam.copy()])
+        beamStates = [beam.copy()]
         for element in elements:
-            steps = np.int(norm(beam.position-beam.collisionPoint(element))/step)-1
+            steps = int(norm(beam.position-beam.collisionPoint(element))/step)-1
             for i in range(steps):
                 beam.propagate(step)
-                beamStates = np.append(beamStates, beam.copy())
+                beamStates.append(beam.copy())
             beam.interact(element)
-            beamStates = np.append(beamStates, beam.copy())
+            beamStates.append(beam.copy())
         for i in range(30):
             beam.propagate(step)
-            beamStates = np.append(beamStates, beam.copy())
-        return beamStates
+            beamStates.append(beam.copy())
+        states = np.empty(len(beamStates), dtype = object)
+        states[:] = beamStates
+        return states
+
+    #Returns the segments of the path tracked by track, as a list of (beam at the start of the segment, number of steps, beam after the element or None after the last element)
+    #Only the elements are traced, the steps in between are left to trackArrays and trackChunks
+    def trackSegments(self, elements, step):
+        beam = self.copy()
+        segments = []
+        for element in elements:
+            steps = max(int(norm(beam.position-beam.collisionPoint(element))/step)-1, 0)
+            start = beam.copy()
+            beam.propagate(steps*step)
+            beam.interact(element)
+            segments.append((start, steps, beam.copy()))
+        start = beam.copy()
+        segments.append((start, 30, None))
+        return segments
+
+    #Number of samples tracked for the given segments
+    def trackCount(self, segments):
+        count = 1
+        for start, steps, end in segments:
+            count = count + steps
+            if end is not None:
+                count = count + 1
+        return count
+
+    #Writes the samples first to last (counted from the start of the segment, 1 is one step after it) into the arrays from the given offset
+    def fillTrackSamples(self, start, step, first, last, positions, widths, radii, offset):
+        distances = np.arange(first, last, dtype = float)*step
+        q = abcdTransform(start.q(), propagationMatrix(distances))
+        rows = slice(offset, offset + len(distances))
+        positions[rows] = start.position + distances[:, np.newaxis]*start.direction
+        with np.errstate(divide = 'ignore'):
+            widths[rows] = start.widthFrom_q(q)
+            radii[rows] = start.radiusFrom_q(q)
+
+    #Same path as track, but returns a dictionary of preallocated arrays with the position, width and radius of curvature of the beam at each sample
+    #The samples are computed per segment with array operations, so the time is linear in the number of samples
+    def trackArrays(self, elements, step):
+        count = self.trackCount(self.trackSegments(elements, step))
+        for chunk in self.trackChunks(elements, step, chunkSize = count):
+            return chunk
+
+    #Generator version of trackArrays, yields the same samples in dictionaries of arrays of at most chunkSize samples, so very fine steps only need memory for one chunk
+    def trackChunks(self, elements, step, chunkSize = 100000):
+        segments = self.trackSegments(elements, step)
+        count = self.trackCount(segments)
+        #Each sample is (beam state at the start of a segment, first step, last step) or (beam state, None, None) for the states after the elements
+        pieces = [(self.copy(), None, None)]
+        for start, steps, end in segments:
+            if steps > 0:
+                pieces.append((start, 1, steps + 1))
+            if end is not None:
+                pieces.append((end, None, None))
+
+        done = 0
+        while done < count:
+            size = min(chunkSize, count - done)
+            positions = np.zeros((size, 3))
+            widths = np.zeros(size)
+            radii = np.zeros(size)
+            filled = 0
+            while filled < size:
+                beam, first, last = pieces[0]
+                if first is None:
+                    positions[filled] = beam.position
+                    widths[filled] = beam.width
+                    radii[filled] = beam.radiusOfCurvature
+                    filled = filled + 1
+                    pieces.pop(0)
+                else:
+                    stop = min(last, first + size - filled)
+                    self.fillTrackSamples(beam, step, first, stop, positions, widths, radii, filled)
+                    filled = filled + stop - first
+                    if stop == last:
+                        pieces.pop(0)
+                    else:
+                        pieces[0] = (beam, stop, last)
+            done = done + size
+            yield {"Positions": positions, "Widths": widths, "RadiiOfCurvature": radii}
     
     def calculateStates(self, elements):
         beam = self.copy()
@@ -344,31 +585,37 @@ class Beam:
         beam = self.copy()
         flags = []
         for element in elements:
-            if beam.collisionQ(element):
-                if (isinstance(element, Mirror) or isinstance(element, FlatMirror)) and element.aperture:
-                    apt = element.apertureObject().copy()
-                    
-                    beamTemp = beam.copy()
-                    beamTemp.interact(apt)
-                    if beamTemp.clippingQ(apt):
-                        flags.append("Warning: Beam clipping with element " + str(apt.ID) + " In")
-
-                    beam.interact(element)
-                    if beam.clippingQ(element):
-                        flags.append("Warning: Beam clipping with element " + str(element.ID))
-
-                    beamTemp = beam.copy()
-                    beamTemp.interact(apt)
-                    if beamTemp.clippingQ(apt):
-                        flags.append("Warning: Beam clipping with element " + str(apt.ID) + " Out")
-        
-                else:
-                    beam.interact(element)
-                    if beam.clippingQ(element):
-                        flags.append("Warning: Beam clipping with element " + str(element.ID))
-        
+            flags = flags + beam.elementFlags(element)
+        return flags
+
+    #Interacts with one element the way calculateFlags does (no interaction if the element is missed) and returns the list of flags raised by that element
+    def elementFlags(self, element):
+        flags = []
+        if self.collisionQ(element):
+            if (isinstance(element, Mirror) or isinstance(element, FlatMirror)) and element.aperture:
+                apt = element.apertureObject().copy()
+
+                beamTemp = self.copy()
+                beamTemp.interact(apt)
+                if beamTemp.clippingQ(apt):
+                    flags.append("Warning: Beam clipping with element " + str(apt.ID) + " In")
+
+                self.interact(element)
+                if self.clippingQ(element):
+                    flags.append("Warning: Beam clipping with element " + str(element.ID))
+
+                beamTemp = self.copy()
+                beamTemp.interact(apt)
+                if beamTemp.clippingQ(apt):
+                    flags.append("Warning: Beam clipping with element " + str(apt.ID) + " Out")
+
             else:
-                flags.append("Error!: Beam not intersecting with element " + str(element.ID))
+                self.interact(element)
+                if self.clippingQ(element):
+                    flags.append("Warning: Beam clipping with element " + str(element.ID))
+
+        else:
+            flags.append("Error!: Beam not intersecting with element " + str(element.ID))
         return flags
     
     #Nicely prints all the attributes of the beam at the moment the function is called
@@ -382,8 +629,579 @@ class Beam:
         "Position : " + str(self.position) + "\n" + \
         "Direction : " + str(self.direction) + "\n"    
     
+#Returns a hashable summary of everything that defines an element (class and attributes), two elements with the same signature interact with a beam in the same way
+def elementSignature(element):
+    signature = [type(element).__name__]
+    for name in sorted(element.__dict__):
+        if not name.startswith('_'):
+            signature.append((name, signatureValue(element.__dict__[name])))
+    return tuple(signature)
+
+#Returns a hashable summary of a beam state
+def beamSignature(beam):
+    return (signatureValue(beam.radiusOfCurvature), signatureValue(beam.width), signatureValue(beam.direction), signatureValue(beam.position), signatureValue(beam.wavelength), signatureValue(beam.indexOfRefraction))
+
+#Converts lists and arrays into tuples so they can be compared and hashed
+def signatureValue(value):
+    if isinstance(value, np.ndarray) or isinstance(value, list) or isinstance(value, tuple):
+        return tuple(np.asarray(value).ravel().tolist())
+    return value
+
+#Class that remembers the beam states after each element of the last traced chain, so when only some elements change the chain is traced again only from the first changed element
+#States and flags are kept separately since calculateFlags does not interact with the elements that are missed
+class IncrementalTracer:
+    #Initialization of the class, starts with nothing traced
+    def __init__(self):
+        self.reset()
+
+    #Forgets everything that was traced
+    def reset(self):
+        #Signature of the source beam of the traced chain
+        self.beamKey = None
+        #Signatures of the elements of the traced chain for the states and for the flags
+        self.stateKeys = []
+        self.flagKeys = []
+        #Beam states after each element, as calculateStates gives them
+        self.states = []
+        #Beam states after each element, as calculateFlags leaves them, and the flags raised by each element
+        self.flagStates = []
+        self.flags = []
+        #Number of elements traced again in the last call of calculateStates and calculateFlags (for diagnostics)
+        self.lastStatesTraced = 0
+        self.lastFlagsTraced = 0
+
+    #Returns the number of leading elements whose signatures are the same in both lists
+    def firstChange(self, keys, newKeys):
+        i = 0
+        while i < len(keys) and i < len(newKeys) and keys[i] == newKeys[i]:
+            i = i + 1
+        return i
+
+    #Checks the source beam, forgets everything if it changed
+    def checkBeam(self, beam):
+        key = beamSignature(beam)
+        if key != self.beamKey:
+            self.reset()
+            self.beamKey = key
+
+    #Same as Beam.calculateStates, only the elements after the first changed one are traced again
+    #The returned states are kept by the tracer and must not be modified
+    def calculateStates(self, beam, elements):
+        self.checkBeam(beam)
+        keys = [elementSignature(element) for element in elements]
+        start = self.firstChange(self.stateKeys, keys)
+        del self.states[start:]
+        if start == 0:
+            beamNow = beam.copy()
+        else:
+            beamNow = self.states[start - 1].copy()
+        for element in elements[start:]:
+            beamNow.interact(element)
+            self.states.append(beamNow.copy())
+        self.stateKeys = keys
+        self.lastStatesTraced = len(elements) - start
+
+        beamStates = {'Source':beam.copy()}
+        for i in range(len(elements)):
+            beamStates[elements[i].ID] = self.states[i]
+        return beamStates
+
+    #Same as Beam.calculateFlags, only the elements after the first changed one are checked again
+    def calculateFlags(self, beam, elements):
+        self.checkBeam(beam)
+        keys = [elementSignature(element) for element in elements]
+        start = self.firstChange(self.flagKeys, keys)
+        del self.flagStates[start:]
+        del self.flags[start:]
+        if start == 0:
+            beamNow = beam.copy()
+        else:
+            beamNow = self.flagStates[start - 1].copy()
+        for element in elements[start:]:
+            self.flags.append(beamNow.elementFlags(element))
+            self.flagStates.append(beamNow.copy())
+        self.flagKeys = keys
+        self.lastFlagsTraced = len(elements) - start
+
+        flags = []
+        for elementFlags in self.flags:
+            flags = flags + elementFlags
+        return flags
+
+#Type codes of the elements of an OpticalSystem
+TYPE_MIRROR = 0
+TYPE_FLAT_MIRROR = 1
+TYPE_LENS = 2
+TYPE_APERTURE = 3
+TYPE_WEDGE_POLARIZER = 4
+TYPE_INFINITE_PLANE = 5
+
+#Class that compiles a list of optical elements into contiguous arrays (one entry per element), so tracing kernels such as BeamBatch do not have to go through the element objects
+class OpticalSystem:
+    #Initialization of the class, packs the attributes of the elements into typed arrays
+    def __init__(self, elements):
+        count = len(elements)
+        #IDs of the elements, in order
+        self.IDs = [element.ID for element in elements]
+        #Type code of each element (TYPE_MIRROR, TYPE_FLAT_MIRROR, TYPE_LENS, TYPE_APERTURE, TYPE_WEDGE_POLARIZER)
+        self.typeCode = np.zeros(count, dtype = np.int8)
+        #Positions of the centers of mass, shape (count, 3)
+        self.positionOfCM = np.zeros((count, 3))
+        #Distances from the centers of mass to the vertices (0 for apertures and wedge polarizers)
+        self.parameter_d = np.zeros(count)
+        #Pitches and yaws of the elements from (1,0,0)
+        self.pitch = np.zeros(count)
+        self.yaw = np.zeros(count)
+        #Radii of curvature of mirrors and lenses (0 for the other elements)
+        self.radiusOfCurvature = np.zeros(count)
+        #Diameters of the elements
+        self.diameter = np.zeros(count)
+        #Concavity of the mirrors and convergence of the lenses
+        self.concave = np.zeros(count, dtype = bool)
+        self.convergent = np.zeros(count, dtype = bool)
+        #Apertures of the mirrors and flat mirrors (distance from the center of mass along the normal and diameter)
+        self.aperture = np.zeros(count, dtype = bool)
+        self.apertureDistance = np.zeros(count)
+        self.apertureDiameter = np.zeros(count)
+        #Angles, minimum widths and orientations of the wedge polarizers
+        self.angle = np.zeros(count)
+        self.minimumWidth = np.zeros(count)
+        self.up = np.zeros(count, dtype = bool)
+        #Indices of refraction of lenses and wedge polarizers (1 for the other elements)
+        self.indexOfRefraction = np.ones(count)
+
+        for i in range(count):
+            element = elements[i]
+            self.positionOfCM[i] = element.positionOfCM
+            self.pitch[i] = element.pitch
+            self.yaw[i] = element.yaw
+            self.diameter[i] = element.diameter
+            if isinstance(element, Mirror):
+                self.typeCode[i] = TYPE_MIRROR
+                self.radiusOfCurvature[i] = element.radiusOfCurvature
+                self.concave[i] = element.concave
+            elif isinstance(element, FlatMirror):
+                self.typeCode[i] = TYPE_FLAT_MIRROR
+            elif isinstance(element, Lens):
+                self.typeCode[i] = TYPE_LENS
+                self.radiusOfCurvature[i] = element.radiusOfCurvature
+                self.convergent[i] = element.convergent
+                self.indexOfRefraction[i] = element.indexOfRefraction
+            elif isinstance(element, Aperture):
+                self.typeCode[i] = TYPE_APERTURE
+            elif isinstance(element, WedgePolarizer):
+                self.typeCode[i] = TYPE_WEDGE_POLARIZER
+                self.angle[i] = element.angle
+                self.minimumWidth[i] = element.minimumWidth
+                self.up[i] = element.up
+                self.indexOfRefraction[i] = element.indexOfRefraction
+            else:
+                raise TypeError("Element " + str(element.ID) + " of type " + type(element).__name__ + " cannot be compiled into an OpticalSystem")
+            if isinstance(element, Mirror) or isinstance(element, FlatMirror) or isinstance(element, Lens):
+                self.parameter_d[i] = element.parameter_d
+            if isinstance(element, Mirror) or isinstance(element, FlatMirror):
+                self.aperture[i] = element.aperture
+                self.apertureDistance[i] = element.apertureDistance
+                self.apertureDiameter[i] = element.apertureDiameter
+
+    #Number of elements in the system
+    def __len__(self):
+        return len(self.typeCode)
+
+    #Returns the list of element objects described by the system
+    def elements(self):
+        elements = []
+        for i in range(len(self)):
+            ID = self.IDs[i]
+            positionOfCM = self.positionOfCM[i].copy()
+            pitch = float(self.pitch[i])
+            yaw = float(self.yaw[i])
+            diameter = float(self.diameter[i])
+            if self.typeCode[i] == TYPE_MIRROR:
+                elements.append(Mirror(ID = ID, radiusOfCurvature = float(self.radiusOfCurvature[i]), positionOfCM = positionOfCM, parameter_d = float(self.parameter_d[i]), yaw = yaw, pitch = pitch, diameter = diameter, concave = bool(self.concave[i]), aperture = bool(self.aperture[i]), apertureDistance = float(self.apertureDistance[i]), apertureDiameter = float(self.apertureDiameter[i])))
+            elif self.typeCode[i] == TYPE_FLAT_MIRROR:
+                elements.append(FlatMirror(ID = ID, positionOfCM = positionOfCM, parameter_d = float(self.parameter_d[i]), yaw = yaw, pitch = pitch, diameter = diameter, aperture = bool(self.aperture[i]), apertureDistance = float(self.apertureDistance[i]), apertureDiameter = float(self.apertureDiameter[i])))
+            elif self.typeCode[i] == TYPE_LENS:
+                elements.append(Lens(ID = ID, radiusOfCurvature = float(self.radiusOfCurvature[i]), positionOfCM = positionOfCM, parameter_d = float(self.parameter_d[i]), yaw = yaw, pitch = pitch, diameter = diameter, indexOfRefraction = float(self.indexOfRefraction[i]), convergent = bool(self.convergent[i])))
+            elif self.typeCode[i] == TYPE_APERTURE:
+                elements.append(Aperture(ID = ID, positionOfCM = positionOfCM, yaw = yaw, pitch = pitch, diameter = diameter))
+            elif self.typeCode[i] == TYPE_WEDGE_POLARIZER:
+                elements.append(WedgePolarizer(ID = ID, positionOfCM = positionOfCM, yaw = yaw, pitch = pitch, diameter = diameter, angle = float(self.angle[i]), minimumWidth = float(self.minimumWidth[i]), indexOfRefraction = float(self.indexOfRefraction[i]), up = bool(self.up[i])))
+        return elements
+
+    #Returns the pitches and yaws of element i for every beam of a batch, extraYaws and extraPitches are arrays of shape (number of elements,) or (count, number of elements), or None
+    def angles(self, i, extraYaws = None, extraPitches = None):
+        pitch = self.pitch[i]
+        yaw = self.yaw[i]
+        if extraPitches is not None:
+            pitch = pitch + np.asarray(extraPitches, dtype = float)[..., i]
+        if extraYaws is not None:
+            yaw = yaw + np.asarray(extraYaws, dtype = float)[..., i]
+        return pitch, yaw
+
+    #Returns the position of the center of mass of element i for every beam of a batch, extraPositions is an array of shape (number of elements, 3) or (count, number of elements, 3), or None
+    def position(self, i, extraPositions = None):
+        if extraPositions is None:
+            return self.positionOfCM[i]
+        return self.positionOfCM[i] + np.asarray(extraPositions, dtype = float)[..., i, :]
+
+    #Returns everything the tracing kernels need to know about element i for arrays of pitches and yaws (one per beam) as a dictionary
+    #The vectors mirror the normal/vertex/center functions of the element classes, and 'aperture' holds the aperture of mirrors in the same format (see apertureObject)
+    #positionOfCM can be given (one per beam) to move the element, by default it is where the system has it
+    def geometry(self, i, pitch, yaw, positionOfCM = None):
+        typeCode = self.typeCode[i]
+        if positionOfCM is None:
+            positionOfCM = self.positionOfCM[i]
+        geometry = {'type': typeCode, 'ID': self.IDs[i], 'diameter': self.diameter[i], 'radiusOfCurvature': self.radiusOfCurvature[i], 'concave': self.concave[i], 'convergent': self.convergent[i], 'indexOfRefraction': self.indexOfRefraction[i]}
+        normal = pitchYawDirection(pitch, yaw)
+        geometry['normal'] = normal
+        if typeCode == TYPE_WEDGE_POLARIZER:
+            angle = self.angle[i]
+            if self.up[i]:
+                normal1 = pitchYawDirection(pitch, yaw + np.pi-angle/2.0)
+                normal2 = pitchYawDirection(pitch, yaw + angle/2.0)
+            else:
+                normal1 = pitchYawDirection(pitch, yaw + angle/2.0)
+                normal2 = pitchYawDirection(pitch, yaw + np.pi-angle/2.0)
+            offset = self.minimumWidth[i]/2.0*(1+np.sin(angle/2.0))
+            geometry['normal1'] = normal1
+            geometry['normal2'] = normal2
+            if self.up[i]:
+                geometry['vertex1'] = positionOfCM + offset*normal1
+                geometry['vertex2'] = positionOfCM + offset*normal2
+            else:
+                geometry['vertex1'] = positionOfCM + offset*normal2
+                geometry['vertex2'] = positionOfCM + offset*normal1
+            return geometry
+
+        geometry['normal1'] = normal
+        geometry['vertex1'] = positionOfCM + self.parameter_d[i]*normal
+        if typeCode == TYPE_MIRROR:
+            if self.concave[i]:
+                geometry['center1'] = geometry['vertex1'] + self.radiusOfCurvature[i]*normal
+            else:
+                geometry['center1'] = geometry['vertex1'] - self.radiusOfCurvature[i]*normal
+        elif typeCode == TYPE_LENS:
+            geometry['vertex2'] = positionOfCM - self.parameter_d[i]*normal
+            if self.convergent[i]:
+                geometry['center1'] = geometry['vertex1'] - self.radiusOfCurvature[i]*normal
+                geometry['center2'] = geometry['vertex1'] + self.radiusOfCurvature[i]*normal
+            else:
+                geometry['center1'] = geometry['vertex1'] + self.radiusOfCurvature[i]*normal
+                geometry['center2'] = geometry['vertex1'] - self.radiusOfCurvature[i]*normal
+        if typeCode == TYPE_MIRROR or typeCode == TYPE_FLAT_MIRROR:
+            geometry['aperture'] = {'type': TYPE_APERTURE, 'ID': self.IDs[i] + " - Aperture", 'diameter': self.apertureDiameter[i], 'normal': normal, 'normal1': normal, 'vertex1': positionOfCM + self.apertureDistance[i]*normal}
+        return geometry
+
+#Returns the OpticalSystem for a list of elements (or the system itself if it is already compiled)
+def compileSystem(elements):
+    if isinstance(elements, OpticalSystem):
+        return elements
+    return OpticalSystem(elements)
+
+#Bits of the flag codes returned by BeamBatch.calculateFlags (one code per beam and element, see flagMessages for their meaning)
+FLAG_MISSED = 1
+FLAG_CLIPPED = 2
+FLAG_APERTURE_IN = 4
+FLAG_APERTURE_OUT = 8
+
+#Returns the list of flag messages of Beam.calculateFlags for the flag codes of one beam (one code per element), only needed when displaying them
+def flagMessages(codes, elements):
+    flags = []
+    for i in range(len(elements)):
+        ID = str(elements[i].ID)
+        if codes[i] & FLAG_MISSED:
+            flags.append("Error!: Beam not intersecting with element " + ID)
+            continue
+        if codes[i] & FLAG_APERTURE_IN:
+            flags.append("Warning: Beam clipping with element " + ID + " - Aperture In")
+        if codes[i] & FLAG_CLIPPED:
+            flags.append("Warning: Beam clipping with element " + ID)
+        if codes[i] & FLAG_APERTURE_OUT:
+            flags.append("Warning: Beam clipping with element " + ID + " - Aperture Out")
+    return flags
+
+#Returns a short label for the flag codes of one beam, such as 'Clear' or 'Clipping IM2 + Missing IM3'
+def flagLabel(codes, elements):
+    labels = []
+    for i in range(len(elements)):
+        if codes[i] & FLAG_MISSED:
+            labels.append('Missing ' + str(elements[i].ID))
+        elif codes[i]:
+            labels.append('Clipping ' + str(elements[i].ID))
+    if len(labels) == 0:
+        return 'Clear'
+    return ' + '.join(labels)
+
+#Groups an array of flag codes of shape (..., number of elements) into classes, returns the label of each class and an array with the class index of every point
+def classifyFlags(flags, elements):
+    flags = np.asarray(flags)
+    codes, inverse = np.unique(flags.reshape(-1, flags.shape[-1]), axis = 0, return_inverse = True)
+    return [flagLabel(code, elements) for code in codes], inverse.reshape(flags.shape[:-1])
+
+#Class used for the propagation of many Gaussian Beams at once, every attribute holds one entry per beam (arrays of shape (count,) or (count, 3))
+#Each beam can see its own pitches and yaws of the elements, so a whole sweep is traced in a single pass
+#The interactions take the geometry dictionaries of OpticalSystem.geometry instead of element objects
+class BeamBatch:
+    #Initialization of the class, all the inputs can be given per beam or once for all beams
+    def __init__(self, radiusOfCurvature, width, direction, position = [0,0,0], wavelength = 1064.0E-9, indexOfRefraction = 1):
+        position = np.array(position, dtype = float).reshape(-1, 3)
+        direction = normalizeArray(np.array(direction, dtype = float).reshape(-1, 3))
+        count = max(len(position), len(direction), np.size(radiusOfCurvature), np.size(width), np.size(indexOfRefraction))
+        #Current positions of the beams, shape (count, 3)
+        self.position = np.array(np.broadcast_to(position, (count, 3)))
+        #Current directions of the beams, shape (count, 3), normalized (essentially k-vectors)
+        self.direction = np.array(np.broadcast_to(direction, (count, 3)))
+        #Wavelength of the beams (shared by all of them)
+        self.wavelength = wavelength
+        #Index of refraction of the medium each beam is in, shape (count,)
+        self.indexOfRefraction = np.array(np.broadcast_to(np.asarray(indexOfRefraction, dtype = float), (count,)))
+        #Complex parameter q of each beam such that 1/q = 1/r - i*lambda/(pi*n*w^2), shape (count,)
+        radiusOfCurvature = np.broadcast_to(np.asarray(radiusOfCurvature, dtype = float), (count,))
+        width = np.broadcast_to(np.asarray(width, dtype = float), (count,))
+        self.qParameter = qFromRadiusAndWidth(radiusOfCurvature, width, self.wavelength, self.indexOfRefraction)
+
+    #Number of beams in the batch
+    def __len__(self):
+        return len(self.qParameter)
+
+    #Returns the parameters q of the beams
+    def q(self):
+        return self.qParameter
+
+    #Current radii of curvature of the beams, calculated from q
+    @property
+    def radiusOfCurvature(self):
+        return radiusFromQ(self.qParameter)
+
+    #Current widths of the beams, calculated from q
+    @property
+    def width(self):
+        return widthFromQ(self.qParameter, self.wavelength, self.indexOfRefraction)
+
+    #Returns a copy of the beams states as they are when the function is called
+    def copy(self):
+        batch = BeamBatch.__new__(BeamBatch)
+        batch.position = self.position.copy()
+        batch.direction = self.direction.copy()
+        batch.wavelength = self.wavelength
+        batch.indexOfRefraction = self.indexOfRefraction.copy()
+        batch.qParameter = self.qParameter.copy()
+        return batch
+
+    #Returns the state of one beam of the batch as a Beam
+    def beam(self, index):
+        beam = Beam(radiusOfCurvature = self.radiusOfCurvature[index], width = self.width[index], direction = self.direction[index], position = self.position[index], wavelength = self.wavelength, indexOfRefraction = self.indexOfRefraction[index], verbose = False)
+        beam.qParameter = self.qParameter[index]
+        return beam
+
+    #Changes the index of refraction of the beams selected by mask, keeping their radius of curvature and width (as it happens with Beam)
+    def setIndexOfRefraction(self, indexOfRefraction, mask):
+        newIndex = np.where(mask, indexOfRefraction, self.indexOfRefraction)
+        self.qParameter = changeIndexOfRefraction(self.qParameter, self.indexOfRefraction, newIndex)
+        self.indexOfRefraction = newIndex
+
+    #Propagates each beam for its given distance (a distance of 0 leaves the beam untouched)
+    def propagate(self, distance):
+        distance = np.asarray(distance, dtype = float)
+        self.qParameter = abcdTransform(self.qParameter, propagationMatrix(distance))
+        self.position = self.position + distance[..., np.newaxis]*self.direction
+
+    #Changes the direction of the beams selected by mask after reflecting on planes perpendicular to the normals
+    def reflect(self, normal, mask):
+        reflected = self.direction - 2*dotArray(self.direction, normal)[..., np.newaxis]*normal
+        self.direction = np.where(mask[..., np.newaxis], reflected, self.direction)
+
+    #Returns the directions of the beams after crossing a surface with the given normals and ratio of indices of refraction k = n1/n2
+    def refractedDirection(self, normal, k):
+        cosI = np.cos(np.arccos(dotArray(-1*self.direction, normal)/(normArray(self.direction)*normArray(normal))))
+        return normalizeArray(k*self.direction + (k*cosI - np.sqrt(1.0 - (k**2)*(1.0 - cosI**2.0)))[..., np.newaxis]*normal)
+
+    #Refracts the beams selected by mask through a lens or wedge polarizer, same steps as Beam.refract
+    def refract(self, geometry, mask):
+        if geometry['type'] == TYPE_LENS:
+            radius = abs(geometry['radiusOfCurvature'])
+            n1 = 1.0
+            n2 = geometry['indexOfRefraction']
+            normal = normalizeArray(geometry['center1'] - self.position)
+            self.direction = np.where(mask[..., np.newaxis], self.refractedDirection(normal, n1/n2), self.direction)
+            self.setIndexOfRefraction(n2, mask)
+            self.qParameter = np.where(mask, abcdTransform(self.qParameter, focusingMatrix((n2-n1)/radius)), self.qParameter)
+            intersection, valid = intersectionBetweenLinesAndSphere(self.direction, self.position, geometry['center2'], radius, geometry['vertex1'])
+            self.propagate(np.where(mask, normArray(self.position - intersection), 0.0))
+            n1 = 1.0*geometry['indexOfRefraction']
+            n2 = 1.0
+            normal = -normalizeArray(geometry['center2'] - self.position)
+            self.direction = np.where(mask[..., np.newaxis], self.refractedDirection(normal, n1/n2), self.direction)
+            self.setIndexOfRefraction(n2, mask)
+            self.qParameter = np.where(mask, abcdTransform(self.qParameter, focusingMatrix((n2-n1)/radius)), self.qParameter)
+        elif geometry['type'] == TYPE_WEDGE_POLARIZER:
+            n1 = 1.0
+            n2 = geometry['indexOfRefraction']
+            self.direction = np.where(mask[..., np.newaxis], self.refractedDirection(geometry['normal1'], n1/n2), self.direction)
+            self.setIndexOfRefraction(n2, mask)
+            intersection, valid = intersectionBetweenLinesAndPlane(self.direction, self.position, geometry['vertex2'], geometry['normal2'])
+            self.propagate(np.where(mask, normArray(self.position - intersection), 0.0))
+            n1 = geometry['indexOfRefraction']
+            n2 = 1.0
+            self.direction = np.where(mask[..., np.newaxis], self.refractedDirection(-geometry['normal2'], n1/n2), self.direction)
+            self.setIndexOfRefraction(1.0, mask)
+
+    #Returns the intersections of the beams with a lens, picking the side the same way Beam.collisionQ does
+    def lensIntersection(self, geometry):
+        intersection1, intersection2, valid = intersectionsBetweenLinesAndSphere(self.direction, self.position, geometry['center1'], geometry['radiusOfCurvature'])
+        if geometry['convergent']:
+            first = dotArray(self.direction, geometry['center1'] - intersection1) > 0
+        else:
+            first = dotArray(self.direction, geometry['center1'] - intersection1) < 0
+        return np.where(first[..., np.newaxis], intersection1, intersection2), valid
+
+    #Returns a boolean array telling which beams will eventually collide with the optical element, same criteria as Beam.collisionQ
+    def collisionQ(self, geometry):
+        typeCode = geometry['type']
+        if typeCode == TYPE_MIRROR:
+            aperture = geometry['aperture']
+            intersectionApt, validApt = intersectionBetweenLinesAndPlane(self.direction, self.position, aperture['vertex1'], aperture['normal1'])
+            intersection, validMirr = intersectionBetweenLinesAndSphere(self.direction, self.position, geometry['center1'], geometry['radiusOfCurvature'], geometry['vertex1'])
+            valid = validApt & validMirr
+        elif typeCode == TYPE_LENS:
+            intersection, valid = self.lensIntersection(geometry)
+        elif typeCode == TYPE_FLAT_MIRROR:
+            aperture = geometry['aperture']
+            intersection, validMirr = intersectionBetweenLinesAndPlane(self.direction, self.position, geometry['vertex1'], geometry['normal1'])
+            intersectionApt, validApt = intersectionBetweenLinesAndPlane(self.direction, self.position, aperture['vertex1'], aperture['normal1'])
+            valid = validMirr & validApt
+        else:
+            intersection, valid = intersectionBetweenLinesAndPlane(self.direction, self.position, geometry['vertex1'], geometry['normal1'])
+        if typeCode == TYPE_INFINITE_PLANE:
+            return valid
+        #Makes sure the intersection point is withing the diameter of the element
+        return valid & (normArray(intersection - geometry['vertex1']) <= geometry['diameter']/2.0)
+
+    #Returns the points where the beams collide with the element and a boolean array that is False where Beam.collisionPoint would return False
+    def collisionPoint(self, geometry):
+        typeCode = geometry['type']
+        if typeCode == TYPE_MIRROR:
+            intersection, valid = intersectionBetweenLinesAndSphere(self.direction, self.position, geometry['center1'], geometry['radiusOfCurvature'], geometry['vertex1'])
+        elif typeCode == TYPE_LENS:
+            intersection, valid = self.lensIntersection(geometry)
+        else:
+            intersection, valid = intersectionBetweenLinesAndPlane(self.direction, self.position, geometry['vertex1'], geometry['normal1'])
+        if typeCode == TYPE_INFINITE_PLANE:
+            return intersection, valid
+        #Makes sure the intersection point is withing the diameter of the element, and makes sure it is in front of the beam's path, not behind.
+        valid = valid & (normArray(intersection - geometry['vertex1']) <= geometry['diameter']/2.0) & (dotArray(self.direction, intersection - self.position) >= 0)
+        return intersection, valid
+
+    #Returns a boolean array telling which beams are clipping with the element
+    def clippingQ(self, geometry):
+        return normArray(geometry['vertex1'] - self.position) + self.width > geometry['diameter']/2.0
+
+    #Makes the beams selected by mask (all of them by default) interact with the element, same steps as Beam.interact
+    def interact(self, geometry, mask = None):
+        typeCode = geometry['type']
+        if mask is None:
+            mask = np.ones(len(self), dtype = bool)
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            hit = mask & self.collisionQ(geometry)
+            point, valid = self.collisionPoint(geometry)
+            #Beam.collisionPoint returns False when the point is behind the beam, which then acts as the origin in the distance calculation
+            point = np.where(valid[..., np.newaxis], point, 0.0)
+            self.propagate(np.where(hit, normArray(self.position - point), 0.0))
+            if typeCode == TYPE_MIRROR:
+                normalToCollisionPoint = normalizeArray(geometry['center1'] - self.position)
+                self.reflect(normalToCollisionPoint, hit)
+                if geometry['concave']:
+                    q = abcdTransform(self.qParameter, focusingMatrix(2.0/geometry['radiusOfCurvature']))
+                else:
+                    q = abcdTransform(self.qParameter, focusingMatrix(-2.0/geometry['radiusOfCurvature']))
+                self.qParameter = np.where(hit, q, self.qParameter)
+            elif typeCode == TYPE_LENS or typeCode == TYPE_WEDGE_POLARIZER:
+                self.refract(geometry, hit)
+            elif typeCode == TYPE_FLAT_MIRROR or typeCode == TYPE_INFINITE_PLANE:
+                self.reflect(geometry['normal'], hit)
+        if typeCode == TYPE_MIRROR or typeCode == TYPE_FLAT_MIRROR or typeCode == TYPE_WEDGE_POLARIZER:
+            miss = mask & ~hit
+            if miss.any():
+                #Same as interacting with InfinitePlane(element.ID, element.vertex1(), element.yaw, element.pitch)
+                self.interact({'type': TYPE_INFINITE_PLANE, 'ID': geometry['ID'], 'normal': geometry['normal'], 'normal1': geometry['normal'], 'vertex1': geometry['vertex1']}, miss)
+
+    #Returns the states of the beams (as BeamBatch copies) after each element, elements can be a list or an OpticalSystem
+    #extraYaws and extraPitches are added to the yaws and pitches of the elements, with shape (number of elements,) or (count, number of elements)
+    #extraPositions is added to the positions of the centers of mass of the elements, with shape (number of elements, 3) or (count, number of elements, 3)
+    def calculateStates(self, elements, extraYaws = None, extraPitches = None, extraPositions = None):
+        system = compileSystem(elements)
+        beam = self.copy()
+        beamStates = {'Source':beam.copy()}
+        for i in range(len(system)):
+            pitch, yaw = system.angles(i, extraYaws, extraPitches)
+            beam.interact(system.geometry(i, pitch, yaw, system.position(i, extraPositions)))
+            beamStates[system.IDs[i]] = beam.copy()
+        return beamStates
+
+    #Returns the flag codes for non-intersection and clipping of every beam with every element, as an array of shape (count, number of elements), same criteria as Beam.calculateFlags
+    #Each code is a combination of FLAG_MISSED, FLAG_CLIPPED, FLAG_APERTURE_IN and FLAG_APERTURE_OUT, and 0 means no flags for that element
+    def calculateFlags(self, elements, extraYaws = None, extraPitches = None, extraPositions = None):
+        system = compileSystem(elements)
+        beam = self.copy()
+        flags = np.zeros((len(self), len(system)), dtype = np.uint8)
+        for i in range(len(system)):
+            pitch, yaw = system.angles(i, extraYaws, extraPitches)
+            geometry = system.geometry(i, pitch, yaw, system.position(i, extraPositions))
+            with np.errstate(divide = 'ignore', invalid = 'ignore'):
+                hit = beam.collisionQ(geometry)
+            flags[:, i] = np.where(hit, 0, FLAG_MISSED)
+            if (geometry['type'] == TYPE_MIRROR or geometry['type'] == TYPE_FLAT_MIRROR) and system.aperture[i]:
+                apt = geometry['aperture']
+
+                beamTemp = beam.copy()
+                beamTemp.interact(apt, hit)
+                flags[:, i] |= np.where(hit & beamTemp.clippingQ(apt), FLAG_APERTURE_IN, 0).astype(np.uint8)
+
+                beam.interact(geometry, hit)
+                flags[:, i] |= np.where(hit & beam.clippingQ(geometry), FLAG_CLIPPED, 0).astype(np.uint8)
+
+                beamTemp = beam.copy()
+                beamTemp.interact(apt, hit)
+                flags[:, i] |= np.where(hit & beamTemp.clippingQ(apt), FLAG_APERTURE_OUT, 0).astype(np.uint8)
+            else:
+                beam.interact(geometry, hit)
+                flags[:, i] |= np.where(hit & beam.clippingQ(geometry), FLAG_CLIPPED, 0).astype(np.uint8)
+        return flags
+
+    #Nicely prints the number of beams and the attributes of the first one
+    def __str__(self):
+        return \
+        "Number of Beams : " + str(len(self)) + "\n" + \
+        "Wavelength : " + str(self.wavelength) + "\n" + \
+        "First Beam :\n" + str(self.beam(0))
+
+#Decorator for the geometry functions of the elements (normal, vertex, center, aperture object), keeps their result until an attribute of the element is assigned again
+#The kept arrays are read only so they cannot be changed by mistake, modifying positionOfCM in place (e.g. positionOfCM[0] = 1) is not detected, assign a new array instead
+def cachedGeometry(function):
+    name = function.__name__
+    def cachedFunction(self):
+        cache = self.__dict__.get('_geometryCache')
+        if cache is None:
+            cache = self.__dict__['_geometryCache'] = {}
+        if name not in cache:
+            value = function(self)
+            if isinstance(value, np.ndarray):
+                value.flags.writeable = False
+            cache[name] = value
+        return cache[name]
+    cachedFunction.__name__ = name
+    cachedFunction.__doc__ = function.__doc__
+    return cachedFunction
+
+#Base class of the optical elements whose geometry is kept by cachedGeometry, assigning any attribute (yaw, pitch, positionOfCM, parameter_d, ...) forgets the kept geometry
+class CachedGeometry:
+    def __setattr__(self, name, value):
+        self.__dict__['_geometryCache'] = {}
+        object.__setattr__(self, name, value)
+
 #Class used for the interaction of the gaussian beam with mirror elements"""    
-class Mirror:
+class Mirror(CachedGeometry):
     #Initialization for the class
     def __init__(self, ID, radiusOfCurvature, positionOfCM, parameter_d, yaw, pitch, diameter, concave, aperture = False, apertureDistance = 0, apertureDiameter = 0):
         #ID of the mirror (for identification).
@@ -410,6 +1228,7 @@ class Mirror:
             self.apertureDiameter = diameter
         
     #Return the position of the center of the sphere of which the mirror is a cap of (think of the mirror as a section of big sphere, this is the center of that sphere), the '1' is so the same function can also be called for lenses without having to test for the type beforehand.
+    @cachedGeometry
     def center1(self):
         if self.concave:
             return self.vertex1() + self.radiusOfCurvature*self.normal()
@@ -419,13 +1238,15 @@ class Mirror:
     def center(self):
         return self.center1()
     #Return the normal of the mirror given the pitch and yaw from (1,0,0)
+    @cachedGeometry
     def normal(self):
-        return rotatePitchYaw([1,0,0], self.pitch, self.yaw)
+        return pitchYawDirection(self.pitch, self.yaw)
     
     def normal1(self):
         return self.normal()
     
     #Returns the position of the actual vertex of the mirror, taking into account the deviation of it from the center of mass and yaw+pitch rotations, the '1' is so the same function can also be called for lenses without having to test for the type beforehand
+    @cachedGeometry
     def vertex1(self):
         return self.positionOfCM + self.parameter_d*self.normal()
     
@@ -436,6 +1257,7 @@ class Mirror:
     def copy(self):
         return Mirror(ID = self.ID, radiusOfCurvature = self.radiusOfCurvature, positionOfCM = self.positionOfCM, parameter_d = self.parameter_d, yaw = self.yaw, pitch = self.pitch, diameter = self.diameter, concave = self.concave)
     
+    @cachedGeometry
     def apertureObject(self):
         return Aperture(ID = self.ID + " - Aperture", positionOfCM = self.positionOfCM + self.apertureDistance*self.normal1(), pitch = self.pitch, yaw = self.yaw, diameter = self.apertureDiameter)
     
@@ -452,7 +1274,7 @@ class Mirror:
         "Diameter : " + str(self.diameter) + "\n" + \
         "Concavity : " + str(self.concave) + "\n"
 
-class FlatMirror:
+class FlatMirror(CachedGeometry):
     def __init__(self, ID, positionOfCM, parameter_d, yaw, pitch, diameter, aperture = False, apertureDistance = 0, apertureDiameter = 0):
         #ID of the flat mirror
         self.ID = ID
@@ -472,16 +1294,19 @@ class FlatMirror:
             self.apertureDiameter = apertureDiameter
         else:
             self.apertureDiameter = diameter
+    @cachedGeometry
     def normal(self):
-        return rotatePitchYaw([1,0,0], self.pitch, self.yaw)
+        return pitchYawDirection(self.pitch, self.yaw)
     def normal1(self):
         return self.normal()
+    @cachedGeometry
     def vertex1(self):
         return self.positionOfCM + self.parameter_d*self.normal()
     def vertex(self):
         return self.vertex1()
     def copy(self):
         return FlatMirror(ID = self.ID, positionOfCM = self.positionOfCM, parameter_d = self.parameter_d, yaw = self.yaw, pitch = self.pitch, diameter = self.diameter)
+    @cachedGeometry
     def apertureObject(self):
         return Aperture(ID = self.ID + " - Aperture", positionOfCM = self.positionOfCM + self.apertureDistance*self.normal1(), pitch = self.pitch, yaw = self.yaw, diameter = self.apertureDiameter)
     
@@ -495,7 +1320,7 @@ class FlatMirror:
         "Normal : " + str(self.normal()) + "\n" + \
         "Diameter : " + str(self.diameter) + "\n"
     
-class Lens:
+class Lens(CachedGeometry):
     def __init__(self, ID, radiusOfCurvature, positionOfCM, parameter_d, yaw, pitch, diameter, indexOfRefraction, convergent):
         #ID of the lens (for identification)
         self.ID = ID
@@ -517,12 +1342,14 @@ class Lens:
         self.convergent = convergent
     
     #Returns the position of the center of the sphere of which the side of the lens where the normal is calculated is a cap of.
+    @cachedGeometry
     def center1(self):
         if self.convergent:
             return self.vertex1() - self.radiusOfCurvature*self.normal()
         else:
             return self.vertex1() + self.radiusOfCurvature*self.normal()
     #Returns the position of the center of the sphere of which the opposide side of the lens where the vertex is NOT located is a cap of.
+    @cachedGeometry
     def center2(self):
         if self.convergent:
             return self.vertex1() + self.radiusOfCurvature*self.normal()
@@ -530,17 +1357,20 @@ class Lens:
             return self.vertex1() - self.radiusOfCurvature*self.normal()
     
     #Return the normal of the lens given the pitch and yaw from (1,0,0)
+    @cachedGeometry
     def normal(self):
-        return rotatePitchYaw([1,0,0], self.pitch, self.yaw)
+        return pitchYawDirection(self.pitch, self.yaw)
     
     def normal1(self):
-        return self.norma()
+        return self.normal()
     
     #Returns the position of the vertex of the lens where is normal is calculated from.
+    @cachedGeometry
     def vertex1(self):
         return self.positionOfCM + self.parameter_d*self.normal()
     
     #Returns the position of the vertex of the lens where is normal NOR is calculated from. (opposite to vertex1)
+    @cachedGeometry
     def vertex2(self):
         return self.positionOfCM - self.parameter_d*self.normal()
     
@@ -589,7 +1419,7 @@ class ThinLens:
     
     #Return the normal of the lens given the pitch and yaw from (1,0,0)
     def normal(self):
-        return rotatePitchYaw([1,0,0], self.pitch, self.yaw)
+        return pitchYawDirection(self.pitch, self.yaw)
     
     def normal1(self):
         return self.normal()
@@ -618,7 +1448,7 @@ class ThinLens:
         "Normal : " + str(self.normal()) + "\n" + \
         "Diameter : " + str(self.diameter) + "\n"        
     
-class Aperture:
+class Aperture(CachedGeometry):
     def __init__(self, ID, positionOfCM, yaw, pitch, diameter):
         #ID of the flat mirror
         self.ID = ID
@@ -630,8 +1460,9 @@ class Aperture:
         self.yaw = yaw
         #Diameter of the Lens
         self.diameter = diameter
+    @cachedGeometry
     def normal(self):
-        return rotatePitchYaw([1,0,0], self.pitch, self.yaw)
+        return pitchYawDirection(self.pitch, self.yaw)
     def normal1(self):
         return self.normal()
     def vertex1(self):
@@ -660,7 +1491,7 @@ class InfinitePlane:
         #Yaw of the flat mirror from (1,0,0) (yaw = axymuthal rotation)
         self.yaw = yaw
     def normal(self):
-        return rotatePitchYaw([1,0,0], self.pitch, self.yaw)
+        return pitchYawDirection(self.pitch, self.yaw)
     def normal1(self):
         return self.normal()
     def vertex1(self):
@@ -677,7 +1508,7 @@ class InfinitePlane:
         "Pitch : " + str(self.pitch) + "\n" + \
         "Normal : " + str(self.normal()) + "\n"
     
-class WedgePolarizer:
+class WedgePolarizer(CachedGeometry):
     def __init__(self, ID, positionOfCM, yaw, pitch, diameter, angle, minimumWidth, indexOfRefraction, up):
         self.ID = ID
         self.positionOfCM = positionOfCM
@@ -689,21 +1520,25 @@ class WedgePolarizer:
         self.indexOfRefraction = indexOfRefraction
         self.up = up
     
+    @cachedGeometry
     def normal1(self):
         if self.up:
-            return rotatePitchYaw(rotateYaw([1,0,0], np.pi-self.angle/2.0), self.pitch, self.yaw)
+            return pitchYawDirection(self.pitch, self.yaw + np.pi-self.angle/2.0)
         else:
-            return rotatePitchYaw(rotateYaw([1,0,0], self.angle/2.0), self.pitch, self.yaw)
+            return pitchYawDirection(self.pitch, self.yaw + self.angle/2.0)
+    @cachedGeometry
     def normal2(self):
         if self.up:
-            return rotatePitchYaw(rotateYaw([1,0,0], self.angle/2.0), self.pitch, self.yaw)
+            return pitchYawDirection(self.pitch, self.yaw + self.angle/2.0)
         else:
-            return rotatePitchYaw(rotateYaw([1,0,0], np.pi-self.angle/2.0), self.pitch, self.yaw)
+            return pitchYawDirection(self.pitch, self.yaw + np.pi-self.angle/2.0)
+    @cachedGeometry
     def vertex1(self):
         if self.up:
             return self.positionOfCM + self.minimumWidth/2.0*(1+np.sin(self.angle/2.0))*self.normal1()
         else:
             return self.positionOfCM + self.minimumWidth/2*(1+np.sin(self.angle/2.0))*self.normal2()
+    @cachedGeometry
     def vertex2(self):
         if self.up:
             return self.positionOfCM + self.minimumWidth/2*(1+np.sin(self.angle/2.0))*self.normal2()
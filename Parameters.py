@@ -3,108 +3,169 @@ import sys
 sys.path.insert(0, '~/Gaussian Beam Propagation')
 #Importing all the definitions form Optics.py
 from Optics import *
+#Importing the loading and calculation functions form Core.py (beamFromFile, elementsFromFile, calculatePlotParameters, sweeps...)
+from Core import *
 
 #Imports numpy
 import numpy as np
-#Imports improtant functions for juptyer display
-from IPython.core.display import display, HTML, Markdown, clear_output
-#Improts matplotlib
-import matplotlib.pyplot as plt
 #Improts widgets for buttons and text boxes for jupyter display
 import ipywidgets as widgets
-#Imports parser for ini files
-import configparser
 #Import os to see files and directories
 import os
+#Imports threading and time for the background worker of the live mode
+import threading
+import time
+
+#Tells if the widgets were already built
+widgetsBuilt = False
+
+#Range and step of the yaw and pitch sliders of the live mode, in milli radians
+sliderRange = 10.0
+sliderStep = 0.001
+
+#Builds the state of the assistant (systems, beam, elements, extra yaws and pitches) and all of its widgets, as globals of this module
+#Nothing is loaded or built on import, this runs the first time the UI asks for any of them (see __getattr__)
+def buildWidgets():
+    global widgetsBuilt
+    global workingDir, systemsFiles, systems, systemIndex
+    global beam, elements, elementsIDs, elementView, elementControl, viewIndex, controlIndex, extraYaws, extraPitches
+    global systemSelectionDropdown, selectSystemButton, showPlotButton, yawTextBox, pitchTextBox, yawUnitsDropdown, pitchUnitsDropdown, elementViewDropdown, elementControlDropdown, setElementButton
+    global showDefaultBeamCheckbox, showDisplacementCheckbox, viewXYPlaneCheckbox, flagFontSizeTextBox, plotFontSizeTextBox, axesTicksTextBox, numberOfCirclesTextBox, numberOfLinesTextBox, beamColorDropdown, mainLabel, optionsLabel
+    global liveModeCheckbox, yawSlider, pitchSlider
+    widgetsBuilt = True
+
+    #Determines current working directory
+    workingDir = os.getcwd()
+
+    #List of all the systems in the 'Systems' folder
+    systemsFiles = [system + '.ini' for system in listSystems(workingDir + '/Systems')]
 
-#Determines current working directory
-#global workingDir
-workingDir = os.getcwd()
-
-#List of all the systems in the 'Systems' folder
-#global systemsFiles
-systemsFiles = [f for f in os.listdir(workingDir + '/Systems') if os.path.isfile(os.path.join(workingDir + '/Systems', f))]
-
-#Removes the ".ini" from the end of the files
-#global systems
-systems = [system[:-4] for system in systemsFiles]
-#Alphabetizes the systems
-systems.sort()
-
-#global systemIndex
-systemIndex = 0
-
-def beamFromFile(filepath):
-    config = configparser.ConfigParser()
-    config.read(filepath)
-    return Beam(radiusOfCurvature = eval(config['Beam']['radiusOfCurvature']), width = eval(config['Beam']['width']), direction = eval(config['Beam']['direction']), position = eval(config['Beam']['position']), wavelength = eval(config['Beam']['wavelength']), indexOfRefraction = eval(config['Beam']['indexOfRefraction']), verbose = eval(config['Beam']['verbose']))
-
-def elementsFromFile(filepath):
-    config = configparser.ConfigParser()
-    config.read(filepath)
-    count = 1
-    elements = []
-    elementNow = 'Element'+'{:02d}'.format(count)
-    while elementNow in config:
-        if config[elementNow]['Type'] == 'Mirror':
-            elements.append(Mirror(ID = config[elementNow]['ID'], radiusOfCurvature = eval(config[elementNow]['radiusOfCurvature']), positionOfCM = eval(config[elementNow]['positionOfCM']), parameter_d = eval(config[elementNow]['parameter_d']), yaw = eval(config[elementNow]['yaw']), pitch = eval(config[elementNow]['pitch']), diameter = eval(config[elementNow]['diameter']), concave = eval(config[elementNow]['concave']), aperture = eval(config[elementNow]['aperture']), apertureDistance = eval(config[elementNow]['apertureDistance']), apertureDiameter = eval(config[elementNow]['apertureDiameter'])))
-            
-        elif config[elementNow]['Type'] == 'Lens':
-            elements.append(Lens(ID = config[elementNow]['ID'], radiusOfCurvature = eval(config[elementNow]['radiusOfCurvature']), positionOfCM = eval(config[elementNow]['positionOfCM']), parameter_d = eval(config[elementNow]['parameter_d']), yaw = eval(config[elementNow]['yaw']), pitch = eval(config[elementNow]['pitch']), diameter = eval(config[elementNow]['diameter']), indexOfRefraction = eval(config[elementNow]['indexOfRefraction']), convergent = eval(config[elementNow]['convergent'])))
-        
-        elif config[elementNow]['Type'] == 'FlatMirror':
-            elements.append(FlatMirror(ID = config[elementNow]['ID'], positionOfCM = eval(config[elementNow]['positionOfCM']), parameter_d = eval(config[elementNow]['parameter_d']), yaw = eval(config[elementNow]['yaw']), pitch = eval(config[elementNow]['pitch']), diameter = eval(config[elementNow]['diameter']), aperture = eval(config[elementNow]['aperture']), apertureDistance = eval(config[elementNow]['apertureDistance']), apertureDiameter = eval(config[elementNow]['apertureDiameter'])))
-        
-        elif config[elementNow]['Type'] == 'Aperture':
-            elements.append(Aperture(ID = config[elementNow]['ID'], positionOfCM = eval(config[elementNow]['positionOfCM']), yaw = eval(config[elementNow]['yaw']), pitch = eval(config[elementNow]['pitch']), diameter = eval(config[elementNow]['diameter'])))
-        
-        elif config[elementNow]['Type'] == 'WedgePolarizer':
-            elements.append(WedgePolarizer(ID = config[elementNow]['ID'], positionOfCM = eval(config[elementNow]['positionOfCM']), yaw = eval(config[elementNow]['yaw']), pitch = eval(config[elementNow]['pitch']), diameter = eval(config[elementNow]['diameter']), angle = eval(config[elementNow]['angle']), minimumWidth = eval(config[elementNow]['minimumWidth']), indexOfRefraction = eval(config[elementNow]['indexOfRefraction']), up = eval(config[elementNow]['up'])))
-        
-        count = count + 1
-        elementNow = 'Element'+'{:02d}'.format(count)
-    return elements
-
-def calculatePlotParameters(beam0, elements0, elementView, elementControl, extraYaws, extraPitches):
-    #Makes a copy of the beam
-    beam = beam0.copy()
-    beamDefault = beam0.copy()
-    #Makes a copy of all the elements
-    elements = [element.copy() for element in elements0]
-    elementsDefault = [element.copy() for element in elements0]
-
-    #Shifts the pitch and yaw of all the elements accordingly
-    for i in range(len(elements)):
-        elements[i].pitch = elements[i].pitch + extraPitches[i]
-        elements[i].yaw = elements[i].yaw + extraYaws[i]
-    #Finds the ID os the element that is being controlled (not useful yet, but no harm in it).
-    for iCtrl in range(len(elements)):
-        if elements[iCtrl].ID == elementControl:
-            break
-    #Finds the ID os the element that is being viewed.
-    for iView in range(len(elements)):
-        if elements[iView].ID == elementView:
-            break
-            
-    #Calculates the states of the beam at each element.
-    states = beam.calculateStates(elements)
-    statesDefault = beam.calculateStates(elementsDefault)
-    #Calculates the flags for non-intersection and clipping
-    flags = beam.calculateFlags(elements)
-    
-    #Returns the dictionary with all necessary information for the plot.
-    return {
-            "Title": "View: " + str(elementView) + " | Control: " + str(elementControl),
-            "Range": np.array([-1, 1])*elements[iView].diameter*1.1/2.0,
-            "BeamCenter": rotatePitchYaw(states[elementView].position - elements[iView].positionOfCM, -elements[iView].pitch, -elements[iView].yaw)[1:],
-            "BeamRadius": states[elementView].width,
-            "BeamCenterDefault": rotatePitchYaw(statesDefault[elementView].position - elementsDefault[iView].positionOfCM, -elementsDefault[iView].pitch, -elementsDefault[iView].yaw)[1:],
-            "BeamRadiusDefault": statesDefault[elementView].width,
-            "Flags": flags            
-           }
+    #Removes the ".ini" from the end of the files
+    systems = [system[:-4] for system in systemsFiles]
+    #Alphabetizes the systems
+    systems.sort()
+
+    systemIndex = 0
+
+    #global beam
+    beam = beamFromFile('Systems/' + systems[systemIndex] + '.ini')
+    #global elements
+    elements = elementsFromFile('Systems/' + systems[systemIndex] + '.ini')
+
+    #Makes list of the ID of the optical elements.
+    #global elementsIDs
+    elementsIDs = np.array([element.ID for element in elements])
+    #Default element to be viewed (last in the series).
+    #global elementView
+    elementView = elementsIDs[-1]
+    #Default element to be controlled (last in the series).
+    #global elementControl
+    elementControl = elementsIDs[0]
+
+    #Finds index of the element being viewed.
+    #global viewIndex
+    viewIndex = np.argwhere(elementsIDs == elementView)[0][0]
+    #Finds index of the element being controlled.
+    #global controlIndex
+    controlIndex = np.argwhere(elementsIDs == elementControl)[0][0]
+
+    #Initialized the "extra Yaws" to be zero for all elements.
+    #global extraYaws
+    extraYaws = np.array([0.0 for element in elements])
+    #Initialized the "extra Pitches" to be zero for all elements.
+    #global extraPitches
+    extraPitches = np.array([0.0 for element in elements])
+
+    #Defines the System Selection Dropdown menu.
+    #global systemSelectionDropdown
+    systemSelectionDropdown = widgets.Dropdown(value = systems[systemIndex], options = systems, description = "System Selection", width = '100%', style = {'description_width': '35%'})
+
+    #Defines Set System Button
+    #global selectSystemButton
+    selectSystemButton = widgets.Button(description = 'Select System!', layout = widgets.Layout(width = '99%'), button_style = 'primary')
+
+    #Defines the "Show Plot!" button.
+    #global showPlotButton
+    showPlotButton = widgets.Button(description = 'Show Plot!', layout = widgets.Layout(width = '99%'), button_style = 'success')
+
+    #Dfines Yaw and Pitch text boxes.
+    #global yawTextBox
+    yawTextBox = widgets.Text(value = str(extraYaws[controlIndex]), description='Extra Yaw', layout = widgets.Layout(width = '15%'))
+    #global pitchTextBox
+    pitchTextBox = widgets.Text(value = str(extraPitches[controlIndex]), description='Extra Pitch', layout = widgets.Layout(width = '15%'))
+    #Defines Yaw and Pitch unit selection dropdown menus.
+    #global yawUnitsDropdown
+    yawUnitsDropdown = widgets.Dropdown(options = ['Radians', 'Milli Radians', 'Micro Radians', 'Nano Radians'], layout = widgets.Layout(width = '10%'))
+    #global pitchUnitsDropdown
+    pitchUnitsDropdown = widgets.Dropdown(options = ['Radians', 'Milli Radians', 'Micro Radians', 'Nano Radians'], layout = widgets.Layout(width = '10%'))
+
+    #Defines element view and controll selection dropdown menus.
+    #global elementViewDropdown
+    elementViewDropdown = widgets.Dropdown(options = elementsIDs, value = elementView, layout = widgets.Layout(width = '20%'), description = 'View Element: ', style = {'description_width': '50%'})
+    #global elementControlDropdown
+    elementControlDropdown = widgets.Dropdown(options = elementsIDs, value = elementControl, layout = widgets.Layout(width = '20%'), description = 'Control Element: ', style = {'description_width': '50%'})
+
+    #Definds "Set Element" button.
+    #global setElementButton
+    setElementButton = widgets.Button(description = 'Set Elements!', layout = widgets.Layout(width = '99%'), button_style = 'primary')
+
+    #Defines "Show Default Beam" checkbox.
+    #global showDefaultBeamCheckbox
+    showDefaultBeamCheckbox = widgets.Checkbox(description = 'Show Default Beam', layout = widgets.Layout(width = '13%'), style = {'description_width': '0%'})
+
+    #Defines "Show displacement" checkbox.
+    showDisplacementCheckbox = widgets.Checkbox(description = 'Show Displacement', layout = widgets.Layout(width = '13%'), style = {'description_width': '0%'})
+
+    viewXYPlaneCheckbox = widgets.Checkbox(description = 'View x-y plane', layout = widgets.Layout(width = '13%'), style = {'description_width': '0%'})
+
+    #Defines Flag Font Size text box.
+    flagFontSizeTextBox = widgets.Text(value = '12', description = 'Flag Font Size', layout = widgets.Layout(width = '20%'), style = {'description_width': '50%'})
+
+    #Defines Plot Font Size text box.
+    #global plotFontSizeTextBox
+    plotFontSizeTextBox = widgets.Text(value = '12', description = 'Plot Font Size', layout = widgets.Layout(width = '20%'), style = {'description_width': '50%'})
+
+    #Defines Axes Ticks text box.
+    #global axesTicksTextBox
+    axesTicksTextBox = widgets.Text(value = '7', description = 'Axes Ticks', layout = widgets.Layout(width = '15%'))
+
+    #Defines Nummber of Circles text box
+    #global numberOfCirclesTextBox
+    numberOfCirclesTextBox = widgets.Text(value = '10', description = 'Number Of Circles', layout = widgets.Layout(width = '15%'), style = {'description_width': '70%'})
+
+    #Defines Nummber of Lines text box
+    #global numberOfLinesTextBox
+    numberOfLinesTextBox = widgets.Text(value = '16', description = 'Number Of Lines', layout = widgets.Layout(width = '15%'), style = {'description_width': '70%'})
+
+    #Defines Beam Color dropdown menu
+    #global beamColorDropdown
+    beamColorDropdown = widgets.Dropdown(options = ['Red', 'Green', 'Blue', 'Cyan', 'Magenta', 'Yellow'], value = 'Red', description = 'Beam Color', layout = widgets.Layout(width = '15%'))
+
+    #global mainLabel
+    mainLabel = widgets.Label(value = 'Initial Allignment Assistant', width = '100%')
+
+    #global optionsLabel
+    optionsLabel = widgets.Label(value = 'Formating Options', width = '100%')
+
+    #Defines "Live Mode" checkbox, the plot follows the sliders while it is checked.
+    liveModeCheckbox = widgets.Checkbox(description = 'Live Mode', layout = widgets.Layout(width = '13%'), style = {'description_width': '0%'})
+
+    #Defines Yaw and Pitch sliders of the control element for the live mode, in milli radians.
+    yawSlider = widgets.FloatSlider(value = 0, min = -sliderRange, max = sliderRange, step = sliderStep, description = 'Yaw (mrad)', readout_format = '.3f', continuous_update = True, layout = widgets.Layout(width = '40%'))
+    pitchSlider = widgets.FloatSlider(value = 0, min = -sliderRange, max = sliderRange, step = sliderStep, description = 'Pitch (mrad)', readout_format = '.3f', continuous_update = True, layout = widgets.Layout(width = '40%'))
+
+#Builds the widgets when one of them (or the state of the assistant) is asked for before buildWidgets was called, e.g. Parameters.beam
+def __getattr__(name):
+    if not widgetsBuilt and not name.startswith('__'):
+        buildWidgets()
+        if name in globals():
+            return globals()[name]
+    raise AttributeError("module 'Parameters' has no attribute '" + name + "'")
 
 def resetWidgets():
-    systemsFiles = [f for f in os.listdir(workingDir + '/Systems') if os.path.isfile(os.path.join(workingDir + '/Systems', f))]
+    if not widgetsBuilt:
+        buildWidgets()
+    systemsFiles = [system + '.ini' for system in listSystems(workingDir + '/Systems')]
 
     #Removes the ".ini" from the end of the files
     #global systems
@@ -191,104 +252,134 @@ def resetWidgets():
     #global beamColorDropdown
     beamColorDropdown.value = 'Red'
 
-#global beam
-beam = beamFromFile('Systems/' + systems[systemIndex] + '.ini')
-#global elements
-elements = elementsFromFile('Systems/' + systems[systemIndex] + '.ini')
-
-#Makes list of the ID of the optical elements.
-#global elementsIDs
-elementsIDs = np.array([element.ID for element in elements])
-#Default element to be viewed (last in the series).
-#global elementView
-elementView = elementsIDs[-1]
-#Default element to be controlled (last in the series).
-#global elementControl
-elementControl = elementsIDs[0]
-
-#Finds index of the element being viewed.
-#global viewIndex
-viewIndex = np.argwhere(elementsIDs == elementView)[0][0]
-#Finds index of the element being controlled.
-#global controlIndex
-controlIndex = np.argwhere(elementsIDs == elementControl)[0][0]
-
-#Initialized the "extra Yaws" to be zero for all elements.
-#global extraYaws
-extraYaws = np.array([0.0 for element in elements])
-#Initialized the "extra Pitches" to be zero for all elements.
-#global extraPitches
-extraPitches = np.array([0.0 for element in elements])
-                   
-#Defines the System Selection Dropdown menu.
-#global systemSelectionDropdown
-systemSelectionDropdown = widgets.Dropdown(value = systems[systemIndex], options = systems, description = "System Selection", width = '100%', style = {'description_width': '35%'})
-   
-#Defines Set System Button
-#global selectSystemButton
-selectSystemButton = widgets.Button(description = 'Select System!', layout = widgets.Layout(width = '99%'), button_style = 'primary')
-
-#Defines the "Show Plot!" button.
-#global showPlotButton
-showPlotButton = widgets.Button(description = 'Show Plot!', layout = widgets.Layout(width = '99%'), button_style = 'success')
-
-#Dfines Yaw and Pitch text boxes.
-#global yawTextBox
-yawTextBox = widgets.Text(value = str(extraYaws[controlIndex]), description='Extra Yaw', layout = widgets.Layout(width = '15%'))
-#global pitchTextBox
-pitchTextBox = widgets.Text(value = str(extraPitches[controlIndex]), description='Extra Pitch', layout = widgets.Layout(width = '15%'))
-#Defines Yaw and Pitch unit selection dropdown menus.
-#global yawUnitsDropdown
-yawUnitsDropdown = widgets.Dropdown(options = ['Radians', 'Milli Radians', 'Micro Radians', 'Nano Radians'], layout = widgets.Layout(width = '10%'))
-#global pitchUnitsDropdown
-pitchUnitsDropdown = widgets.Dropdown(options = ['Radians', 'Milli Radians', 'Micro Radians', 'Nano Radians'], layout = widgets.Layout(width = '10%'))
-
-#Defines element view and controll selection dropdown menus.
-#global elementViewDropdown
-elementViewDropdown = widgets.Dropdown(options = elementsIDs, value = elementView, layout = widgets.Layout(width = '20%'), description = 'View Element: ', style = {'description_width': '50%'})
-#global elementControlDropdown
-elementControlDropdown = widgets.Dropdown(options = elementsIDs, value = elementControl, layout = widgets.Layout(width = '20%'), description = 'Control Element: ', style = {'description_width': '50%'})
-
-#Definds "Set Element" button.
-#global setElementButton
-setElementButton = widgets.Button(description = 'Set Elements!', layout = widgets.Layout(width = '99%'), button_style = 'primary')
-
-#Defines "Show Default Beam" checkbox.
-#global showDefaultBeamCheckbox
-showDefaultBeamCheckbox = widgets.Checkbox(description = 'Show Default Beam', layout = widgets.Layout(width = '13%'), style = {'description_width': '0%'})
-
-#Defines "Show displacement" checkbox.
-showDisplacementCheckbox = widgets.Checkbox(description = 'Show Displacement', layout = widgets.Layout(width = '13%'), style = {'description_width': '0%'})
-
-viewXYPlaneCheckbox = widgets.Checkbox(description = 'View x-y plane', layout = widgets.Layout(width = '13%'), style = {'description_width': '0%'})
-
-#Defines Flag Font Size text box.
-flagFontSizeTextBox = widgets.Text(value = '12', description = 'Flag Font Size', layout = widgets.Layout(width = '20%'), style = {'description_width': '50%'})
-
-#Defines Plot Font Size text box.
-#global plotFontSizeTextBox
-plotFontSizeTextBox = widgets.Text(value = '12', description = 'Plot Font Size', layout = widgets.Layout(width = '20%'), style = {'description_width': '50%'})
-
-#Defines Axes Ticks text box.
-#global axesTicksTextBox
-axesTicksTextBox = widgets.Text(value = '7', description = 'Axes Ticks', layout = widgets.Layout(width = '15%'))
-
-#Defines Nummber of Circles text box
-#global numberOfCirclesTextBox
-numberOfCirclesTextBox = widgets.Text(value = '10', description = 'Number Of Circles', layout = widgets.Layout(width = '15%'), style = {'description_width': '70%'})
-
-#Defines Nummber of Lines text box
-#global numberOfLinesTextBox
-numberOfLinesTextBox = widgets.Text(value = '16', description = 'Number Of Lines', layout = widgets.Layout(width = '15%'), style = {'description_width': '70%'})
-
-#Defines Beam Color dropdown menu
-#global beamColorDropdown
-beamColorDropdown = widgets.Dropdown(options = ['Red', 'Green', 'Blue', 'Cyan', 'Magenta', 'Yellow'], value = 'Red', description = 'Beam Color', layout = widgets.Layout(width = '15%'))
-
-#global mainLabel
-mainLabel = widgets.Label(value = 'Initial Allignment Assistant', width = '100%')
-
-#global optionsLabel
-optionsLabel = widgets.Label(value = 'Formating Options', width = '100%')
-
-
+    #Turns the live mode off and centers its sliders
+    liveModeCheckbox.value = False
+    yawSlider.value = 0
+    pitchSlider.value = 0
+
+#Returns the event loop of the Jupyter kernel, so the live mode draws on the thread of the kernel, or None outside of Jupyter
+def kernelLoop():
+    try:
+        from IPython import get_ipython
+    except ImportError:
+        return None
+    kernel = getattr(get_ipython(), 'kernel', None)
+    return getattr(kernel, 'io_loop', None)
+
+#Class that computes on a background thread for the live mode, so moving the sliders never waits for a plot
+#request(*arguments) asks for compute(*arguments), the requests closer than delay seconds are debounced (only the last one is computed)
+#Every request supersedes the older ones, the superseded ones that were not computed yet are skipped and the results of the ones being computed are thrown away, draw(result) is only called with the result of the latest request
+#The errors of compute and draw are kept in error and given to report(error) when there is one (e.g. to show them in the output of the notebook)
+class LiveUpdater:
+    def __init__(self, compute, draw, delay = 0.03, report = None):
+        self.compute = compute
+        self.draw = draw
+        self.delay = delay
+        self.report = report
+        #Number of the latest request, a result is drawn only if it is still the latest when it is done
+        self.generation = 0
+        #Arguments of the latest request, None once the worker took them
+        self.pending = None
+        self.lastRequest = 0.0
+        #Number of the last request that was finished (drawn, thrown away or failed)
+        self.finished = 0
+        #Counts of the results drawn and thrown away, and the last error of compute or draw
+        self.drawn = 0
+        self.superseded = 0
+        self.error = None
+        self.condition = threading.Condition()
+        #Worker thread, None when there is none (it is cleared by the worker when it stops)
+        self.thread = None
+        self.running = False
+        #Results are drawn on the thread of the kernel when there is one (the plots and widgets are not thread safe), by the worker otherwise
+        self.loop = kernelLoop()
+
+    #Asks for the result of compute(*arguments), the worker starts when there is none (also after stop)
+    def request(self, *arguments):
+        with self.condition:
+            self.generation = self.generation + 1
+            self.pending = arguments
+            self.lastRequest = time.perf_counter()
+            self.running = True
+            if self.thread is None:
+                self.thread = threading.Thread(target = self.run, name = 'LiveUpdater', daemon = True)
+                self.thread.start()
+            self.condition.notify_all()
+
+    #Tells if a request is still the latest one
+    def isCurrent(self, generation):
+        return generation == self.generation
+
+    #Loop of the worker
+    def run(self):
+        while True:
+            with self.condition:
+                while self.running and self.pending is None:
+                    self.condition.wait()
+                #Debounces, waits until there was no request for delay seconds
+                while self.running:
+                    remaining = self.lastRequest + self.delay - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+                if not self.running:
+                    self.thread = None
+                    return
+                arguments = self.pending
+                generation = self.generation
+                self.pending = None
+            try:
+                result = self.compute(*arguments)
+            except Exception as error:
+                self.schedule(self.fail, generation, error)
+                continue
+            self.schedule(self.finish, generation, result)
+
+    #Calls function(*arguments) on the thread of the kernel when there is one, right away otherwise
+    def schedule(self, function, *arguments):
+        if self.loop is None:
+            function(*arguments)
+        else:
+            self.loop.add_callback(function, *arguments)
+
+    #Draws a result if no newer request came while it was computed
+    def finish(self, generation, result):
+        if not self.isCurrent(generation):
+            self.superseded = self.superseded + 1
+            self.done(generation)
+            return
+        try:
+            self.draw(result)
+            self.drawn = self.drawn + 1
+        except Exception as error:
+            self.fail(generation, error)
+            return
+        self.done(generation)
+
+    #Keeps and reports an error of compute or draw
+    def fail(self, generation, error):
+        self.error = error
+        if self.report is not None:
+            try:
+                self.report(error)
+            except Exception:
+                pass
+        self.done(generation)
+
+    #Marks a request as finished and wakes up wait
+    def done(self, generation):
+        with self.condition:
+            self.finished = generation
+            self.condition.notify_all()
+
+    #Waits (at most timeout seconds) until the latest request is finished, True if it is (outside of Jupyter, in Jupyter the drawing needs the kernel)
+    def wait(self, timeout = 5.0):
+        with self.condition:
+            return self.condition.wait_for(lambda: self.finished == self.generation, timeout)
+
+    #Stops the worker, the pending request is dropped
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.pending = None
+            self.condition.notify_all()
@@ -0,0 +1,94 @@
+#Parity check of the Initial Allignment Assistant: traces the shipped systems with random extra yaws and pitches of every element, with BeamBatch and with the scalar Beam, and compares them
+#BeamBatch.calculateStates and BeamBatch.calculateFlags are what the plots, sweeps and alignment use, this checks they still give what Beam.calculateStates and Beam.calculateFlags give
+#Usage: python Parity.py [--count 300] [--scale 1e-3] [--seed 0] [--tolerance 1e-8]
+#Also checks that findRanges gives the ranges in the order of the movable elements it is given
+#Exits with 1 if a flag differs, a position, direction or width differs by more than the tolerance, or the ranges come out of order
+#Only needs numpy (and Core.py)
+#Importing the loading and calculation functions form Core.py (and Optics.py through it)
+from Core import *
+#Importing findRanges, whose order is checked too
+from Alignment import findRanges
+
+#Imports numpy
+import numpy as np
+#Imports the standard library modules for the command line
+import argparse
+import configparser
+import sys
+
+#Returns new elements of a compiled system (with their apertures) with the extra yaws and pitches added
+def perturbedElements(system, extraYaws, extraPitches):
+    elements = system.elements()
+    for i in range(len(elements)):
+        elements[i].yaw = elements[i].yaw + extraYaws[i]
+        elements[i].pitch = elements[i].pitch + extraPitches[i]
+    return elements
+
+#Traces count random configurations of a system file (extra yaws and pitches uniform in [-scale, scale] for every element) both ways
+#Returns a dictionary with the number of configurations whose flags differ and the largest differences of the positions, directions and widths on every element
+def checkSystem(filepath, count = 300, scale = 1e-3, seed = 0):
+    beam, system = loadSystem(filepath)
+    random = np.random.RandomState(seed)
+    extraYaws = random.uniform(-scale, scale, size = (count, len(system)))
+    extraPitches = random.uniform(-scale, scale, size = (count, len(system)))
+
+    batch = beam.toBatch(count)
+    batchStates = batch.calculateStates(system, extraYaws, extraPitches)
+    batchFlags = batch.calculateFlags(system, extraYaws, extraPitches)
+
+    result = {"Configurations": count, "FlagMismatches": 0, "MaxPositionError": 0.0, "MaxDirectionError": 0.0, "MaxWidthError": 0.0}
+    for k in range(count):
+        elements = perturbedElements(system, extraYaws[k], extraPitches[k])
+        states = beam.calculateStates(elements)
+        if beam.calculateFlags(elements) != flagMessages(batchFlags[k], elements):
+            result["FlagMismatches"] = result["FlagMismatches"] + 1
+        for ID in system.IDs:
+            result["MaxPositionError"] = max(result["MaxPositionError"], float(np.abs(states[ID].position - batchStates[ID].position[k]).max()))
+            result["MaxDirectionError"] = max(result["MaxDirectionError"], float(np.abs(states[ID].direction - batchStates[ID].direction[k]).max()))
+            result["MaxWidthError"] = max(result["MaxWidthError"], float(abs(states[ID].width - batchStates[ID].width[k])))
+    return result
+
+#Tells if findRanges of a system (a name in Systems/) gives the range of each element in the place of its ID, by asking for the elements in reverse order and for an element that does not exist
+def checkRanges(system, rays = 4, tolerance = 1e-4):
+    beam, opticalSystem = loadSystem('Systems/' + system + '.ini')
+    IDs = list(opticalSystem.IDs)
+    ranges = findRanges(system + '.ini', IDs, rays = rays, tolerance = tolerance)
+    reversedRanges = findRanges(system + '.ini', IDs[::-1], rays = rays, tolerance = tolerance)
+    try:
+        findRanges(system + '.ini', IDs + ['No such element'], rays = rays, tolerance = tolerance)
+        return False
+    except ValueError:
+        return ranges == reversedRanges[::-1]
+
+def main(arguments = None):
+    parser = argparse.ArgumentParser(description = 'Parity of BeamBatch and Beam on the shipped systems')
+    parser.add_argument('--count', type = int, default = 300, help = 'random configurations per system')
+    parser.add_argument('--scale', type = float, default = 1e-3, help = 'largest extra yaw and pitch, in radians')
+    parser.add_argument('--seed', type = int, default = 0)
+    parser.add_argument('--tolerance', type = float, default = 1e-8, help = 'largest difference allowed in the positions, directions and widths')
+    options = parser.parse_args(arguments)
+
+    failures = 0
+    print('{:<25}{:>10}{:>16}{:>16}{:>16}{:>10}'.format('System', 'Flags', 'Position', 'Direction', 'Width', 'Ranges'))
+    for system in listSystems('Systems'):
+        #Only the files that cannot be parsed are skipped
+        try:
+            loadSystem('Systems/' + system + '.ini')
+        except (configparser.Error, ValueError) as error:
+            print('{:<25}'.format(system) + 'not loaded: ' + str(error).split('\n')[0])
+            continue
+        #Any other error is a failure
+        try:
+            result = checkSystem('Systems/' + system + '.ini', options.count, options.scale, options.seed)
+            rangesInOrder = checkRanges(system)
+        except Exception as error:
+            failures = failures + 1
+            print('{:<25}'.format(system) + 'failed: ' + type(error).__name__ + ': ' + str(error).split('\n')[0] + '  <-- differs')
+            continue
+        failed = result["FlagMismatches"] > 0 or max(result["MaxPositionError"], result["MaxDirectionError"], result["MaxWidthError"]) > options.tolerance or not rangesInOrder
+        failures = failures + int(failed)
+        print('{:<25}{:>10}{:>16.3e}{:>16.3e}{:>16.3e}'.format(system, str(result["FlagMismatches"]) + '/' + str(result["Configurations"]), result["MaxPositionError"], result["MaxDirectionError"], result["MaxWidthError"]) + '{:>10}'.format('ok' if rangesInOrder else 'differs') + ('  <-- differs' if failed else ''))
+    return 1 if failures > 0 else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,225 @@
+#Plotting of the Initial Allignment Assistant: color images of the output space and projection maps, computed on whole arrays of points, and the renderer of the state plot of the assistant
+#Needs numpy and matplotlib
+#Imports numpy
+import numpy as np
+#Imports matplotlib, its colormaps and what the state plot is made of
+import matplotlib
+import matplotlib.cm as cm
+import matplotlib.pyplot as plt
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import LineCollection, PatchCollection
+from matplotlib.figure import Figure
+from matplotlib.patches import Circle
+#Importing the flag codes and norm form Optics.py
+from Optics import FLAG_MISSED, norm
+
+#Returns the colors (floats, shape (..., 4)) of the points x, y of the output space (the beam center on the view element relative to its radius), same as the old colorPointDiscrete and colorPointContinuous of Plots.ipynb
+#discrete = True takes the hue and transparency of the sector (angLines sectors) and ring (radLines rings) of the point, discrete = False the ones of the point itself
+#The points outside the unit circle and on the lines are black, alphaFactor (a number or one per point) scales the transparency of the others
+def outputSpaceColors(x, y, discrete = True, radLines = 10, angLines = 10, lineThickness = .01, alphaFactor = 1):
+    x, y = np.broadcast_arrays(np.asarray(x, dtype = float), np.asarray(y, dtype = float))
+    r = np.sqrt(x**2 + y**2)
+    ph = np.arctan2(y, x)%(2*np.pi)
+
+    if discrete:
+        #Upper edge of the sector and ring of each point
+        phs = np.linspace(0, 2*np.pi, num = angLines + 1)
+        rs = np.linspace(0, 1, num = radLines + 1)
+        hue = phs[np.minimum(np.searchsorted(phs, ph, side = 'right'), angLines)]/(2*np.pi)
+        radius = rs[np.minimum(np.searchsorted(rs, r, side = 'right'), radLines)]
+    else:
+        hue = ph/(2*np.pi)
+        radius = r
+    colors = np.array(cm.hsv(hue), dtype = float)
+    colors[..., 3] = np.exp(-2*radius)*alphaFactor
+
+    black = r > 1
+    if angLines != 0:
+        for rho in [1/angLines*n for n in range(angLines)]:
+            black |= np.abs(r - rho) <= lineThickness
+    if radLines != 0:
+        for th in [2*np.pi/radLines*n for n in range(radLines)]:
+            black |= np.sqrt((x - r*np.cos(th))**2 + (y - r*np.sin(th))**2) <= lineThickness
+    colors[black] = (0, 0, 0, 1)
+    return colors
+
+#Converts colors (floats from 0 to 1, shape (..., 4)) into a uint8 RGBA image that imshow takes as it is
+def rgbaImage(colors):
+    return np.round(np.clip(colors, 0, 1)*255).astype(np.uint8)
+
+#Returns the uint8 RGBA image of the output space at the points x, y (e.g. from np.meshgrid), see outputSpaceColors
+def outputSpaceImage(x, y, discrete = True, radLines = 10, angLines = 10, lineThickness = .01, alphaFactor = 1):
+    return rgbaImage(outputSpaceColors(x, y, discrete = discrete, radLines = radLines, angLines = angLines, lineThickness = lineThickness, alphaFactor = alphaFactor))
+
+#Returns the uint8 RGBA image of a projection map: the color of the beam center of each point on the view element (centers, shape (..., 2), e.g. from tracePoints) in the output space of radius radius
+#flags are the flag codes of each point (shape (..., number of elements)), the points without flags get the full color, the clipping ones a faded darker color and the ones missing an element only the lines (or missingColor when given, e.g. (0, 0, 0, 1) for black)
+def projectionMapImage(centers, flags, radius, discrete = True, radLines = 10, angLines = 10, lineThickness = .005, missingColor = None):
+    centers = np.asarray(centers)
+    flags = np.asarray(flags)
+    x = centers[..., 0]/radius
+    y = centers[..., 1]/radius
+    missing = np.any(flags & FLAG_MISSED, axis = -1)
+    clipping = np.any(flags, axis = -1) & ~missing
+    alphaFactor = np.where(missing, 0.0, np.where(clipping, 0.3, 1.0))
+    colors = outputSpaceColors(x, y, discrete = discrete, radLines = radLines, angLines = angLines, lineThickness = lineThickness, alphaFactor = alphaFactor)
+    colors[clipping] = 0.5*colors[clipping] + 0.5*np.array([0, 0, 0, 1])
+    if missingColor is not None:
+        colors[missing] = missingColor
+    return rgbaImage(colors)
+
+#Class that draws the state plot of the assistant (the one of drawState in Main - New.ipynb) on one figure that is kept between plots
+#The static part (title, axes, grid and edge of the view element) is built once per view element and formatting options, each plot only moves the beam disks, default beam disks, displacement and flag text
+#The grid circles and lines are one collection each, so neither the building nor the drawing depends on numberOfCircles and numberOfLines
+#With an interactive backend that supports it (e.g. ipympl) the plots are blitted on top of a saved image of the static part, otherwise the figure is drawn again (and shown again by the notebook, see interactive)
+class StateRenderer:
+    def __init__(self, figsize = (15, 10), dpi = 80, blit = None):
+        #The inline backend shows copies of the figure, the figure is then made outside of pyplot so it is not shown again at the end of a cell
+        backend = matplotlib.get_backend().lower()
+        self.interactive = not ('inline' in backend or backend == 'agg')
+        if self.interactive:
+            self.figure = plt.figure(figsize = figsize, dpi = dpi, facecolor = 'w', edgecolor = 'k')
+        else:
+            self.figure = Figure(figsize = figsize, dpi = dpi, facecolor = 'w', edgecolor = 'k')
+            FigureCanvasAgg(self.figure)
+        self.ax = self.figure.gca()
+        if blit is None:
+            blit = self.interactive and getattr(self.figure.canvas, 'supports_blit', False)
+        self.blit = blit
+        #Static part of the plot the figure has, and image of it for the blitting
+        self.key = None
+        self.background = None
+        self.artists = []
+        if self.blit:
+            self.figure.canvas.mpl_connect('draw_event', self.onDraw)
+
+    #Everything the static part depends on
+    def staticKey(self, plotParameters, optionsDict):
+        return (plotParameters['Title'], tuple(plotParameters['Range']), optionsDict['numberOfCircles'], optionsDict['numberOfLines'], optionsDict['axesTicks'], optionsDict['plotFontSize'])
+
+    #Builds the static part of the plot, and the artists that change between plots
+    def buildStatic(self, plotParameters, optionsDict):
+        ax = self.ax
+        plotRange = plotParameters['Range']
+        numberOfTicks = optionsDict['axesTicks']
+        plotFontSize = optionsDict['plotFontSize']
+        numberOfCircles = optionsDict['numberOfCircles']
+        numberOfLines = optionsDict['numberOfLines']
+        #Radius of the view element
+        radius = -plotRange[0]/1.1
+
+        #Same axes as resetPlot and drawState
+        ax.cla()
+        ax.set_aspect(1)
+        ax.spines['left'].set_position('center')
+        ax.spines['bottom'].set_position('center')
+        ax.spines['right'].set_color('none')
+        ax.spines['top'].set_color('none')
+        ax.set_title(plotParameters['Title'], fontsize = int(plotFontSize*1.5))
+        ax.set_xlim(plotRange)
+        ax.set_ylim(plotRange)
+        ticks = np.arange(plotRange[0]/1.1, plotRange[1]/1.1+1, (plotRange[1] - plotRange[0])/(1.1*(numberOfTicks-1)))
+        ax.xaxis.set_ticks(ticks)
+        ax.yaxis.set_ticks(ticks)
+        ax.tick_params(axis = 'x', which = 'major', rotation = 45)
+        ax.tick_params(axis = 'x', labelsize = plotFontSize)
+        ax.tick_params(axis = 'y', labelsize = plotFontSize)
+
+        #Constant radius circles, constant angle lines and edge of the element
+        ax.add_collection(PatchCollection([Circle((0, 0), radius/numberOfCircles*i) for i in range(numberOfCircles)], facecolor = 'none', edgecolor = 'black', alpha = .3, linewidth = 1))
+        angles = 2.0*np.pi/max(numberOfLines, 1)*np.arange(numberOfLines)
+        ax.add_collection(LineCollection([[(0, 0), (-radius*np.cos(angle), -radius*np.sin(angle))] for angle in angles], colors = 'black', alpha = .3))
+        ax.add_patch(Circle((0, 0), radius, color = 'black', fill = False, linewidth = 2))
+
+        #Artists that change between plots: default beam, displacement, beam and flags
+        self.defaultDisks = [ax.add_patch(Circle((0, 0), 1, color = 'black', fill = True, alpha = alpha)) for alpha in [.25, .375, .5]]
+        self.displacementLine = ax.plot([0, 0], [0, 0], color = 'blue', alpha = .5)[0]
+        self.displacementText = ax.text(0, 0, '', color = 'blue', alpha = 1, fontsize = plotFontSize)
+        self.beamDisks = [ax.add_patch(Circle((0, 0), 1, fill = True, alpha = alpha)) for alpha in [.5, .75]]
+        self.beamCenterDisk = ax.add_patch(Circle((0, 0), 1, color = 'black', fill = True, alpha = 1))
+        self.flagText = ax.text(radius*1.1, radius*1.1, '', color = 'red')
+        self.artists = self.defaultDisks + [self.displacementLine, self.displacementText] + self.beamDisks + [self.beamCenterDisk, self.flagText]
+        #The axes go over the beams and under the texts, so they are blitted too (they do not depend on the grid options)
+        self.artists = sorted(self.artists + list(ax.spines.values()) + [ax.xaxis, ax.yaxis], key = lambda artist: artist.get_zorder())
+        for artist in self.artists:
+            artist.set_animated(self.blit)
+        self.key = self.staticKey(plotParameters, optionsDict)
+        self.background = None
+
+    #Moves the artists that change between plots
+    def update(self, plotParameters, optionsDict):
+        center = plotParameters['BeamCenter']
+        beamRadius = plotParameters['BeamRadius']
+        for disk, fraction in zip(self.defaultDisks, [1.0, 3.0, 50.0]):
+            disk.set_center(plotParameters['BeamCenterDefault'])
+            disk.set_radius(plotParameters['BeamRadiusDefault']/fraction)
+            disk.set_visible(bool(optionsDict['showDefaultBeam']))
+        self.displacementLine.set_data([0, center[0]], [0, center[1]])
+        self.displacementText.set_position((center[0], center[1]))
+        self.displacementText.set_text("\u0394S = " + str(norm(center)))
+        self.displacementLine.set_visible(bool(optionsDict['showDisplacement']))
+        self.displacementText.set_visible(bool(optionsDict['showDisplacement']))
+        for disk, fraction in zip(self.beamDisks, [1.0, 2.0]):
+            disk.set_center(center)
+            disk.set_radius(beamRadius/fraction)
+            disk.set_color(optionsDict['beamColor'])
+        self.beamCenterDisk.set_center(center)
+        self.beamCenterDisk.set_radius(beamRadius/50.0)
+        self.flagText.set_text(''.join(flag + '\n' for flag in plotParameters['Flags']))
+        self.flagText.set_fontsize(optionsDict['flagFontSize'])
+
+    #Draws a plot, plotParameters from calculatePlotParameters and optionsDict as the one of drawState
+    def draw(self, plotParameters, optionsDict):
+        if self.staticKey(plotParameters, optionsDict) != self.key:
+            self.buildStatic(plotParameters, optionsDict)
+        self.update(plotParameters, optionsDict)
+        canvas = self.figure.canvas
+        if not self.blit:
+            canvas.draw_idle()
+            return
+        if self.background is None:
+            #Draws the static part, onDraw saves it and blits the rest
+            canvas.draw()
+        else:
+            self.blitArtists()
+
+    #Draws the artists that change on top of the saved static part
+    def blitArtists(self):
+        canvas = self.figure.canvas
+        canvas.restore_region(self.background)
+        for artist in self.artists:
+            self.figure.draw_artist(artist)
+        canvas.blit(self.figure.bbox)
+        canvas.flush_events()
+
+    #Saves the static part every time the whole figure is drawn (first plot, new static part, resizes...)
+    def onDraw(self, event):
+        canvas = self.figure.canvas
+        self.background = canvas.copy_from_bbox(self.figure.bbox)
+        for artist in self.artists:
+            self.figure.draw_artist(artist)
+
+#Returns the uint8 RGBA image of a heat map: the distance of the beam center of each point to the center of the view element (centers, shape (..., 2), e.g. from sweepMap), relative to its radius radius, in the colormap cmap
+#flags are the flag codes of each point (shape (..., number of elements)), the points missing an element are black and the clipping ones a faded darker color
+def heatMapImage(centers, flags, radius, cmap = cm.Reds):
+    centers = np.asarray(centers)
+    flags = np.asarray(flags)
+    distance = np.sqrt(centers[..., 0]**2 + centers[..., 1]**2)/radius
+    missing = np.any(flags & FLAG_MISSED, axis = -1)
+    clipping = np.any(flags, axis = -1) & ~missing
+    colors = np.array(cmap(distance), dtype = float)
+    colors[clipping] = 0.5*np.array(cmap(distance[clipping], .3)) + 0.5*np.array([0, 0, 0, 1])
+    colors[missing] = (0, 0, 0, 1)
+    return rgbaImage(colors)
+
+#Returns the colors (floats, shape (pitches, yaws, 4)) of a range diagram: the color colors[k] of the flags of each point, from the indices flagIndex (shape (yaws, pitches), e.g. from classifyFlags), with the pitches going up and the yaws to the right as imshow shows it
+#The points whose color differs from one of their 4 neighbours are made black lineWidthPixels times, which draws the boundaries between the flags (the points on the edges of the image are never black)
+#Same image as the old nested lists, rotateMatrix and boundary loops of Plots.ipynb
+def rangeDiagramColors(flagIndex, colors, lineWidthPixels = 0):
+    colors = np.asarray(colors, dtype = float)
+    image = np.rot90(colors[np.asarray(flagIndex)]).copy()
+    for repeat in range(lineWidthPixels):
+        total = image.sum(axis = -1)
+        inner = total[1:-1, 1:-1]
+        boundary = (inner != total[2:, 1:-1]) | (inner != total[:-2, 1:-1]) | (inner != total[1:-1, 2:]) | (inner != total[1:-1, :-2])
+        image[1:-1, 1:-1][boundary] = (0, 0, 0, 1)
+    return image
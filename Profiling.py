@@ -0,0 +1,147 @@
+#Profiling of the Initial Allignment Assistant: opt-in counters of the calls and wall time of the interaction routines of Optics.py, per element ID and per element type
+#Nothing is wrapped until enableProfiling is called and disableProfiling puts the original functions back, so it costs nothing when disabled
+#Only the calls in this process are counted, run sweeps with processes = 1 to profile them
+#Usage:
+#   with profiling() as profile:
+#       sweepAlignmentMap(...)
+#   print(profile.table(by = 'Type'))
+#Only needs numpy (and Optics.py)
+import Optics
+from Optics import Beam, BeamBatch, TYPE_MIRROR, TYPE_FLAT_MIRROR, TYPE_LENS, TYPE_APERTURE, TYPE_WEDGE_POLARIZER, TYPE_INFINITE_PLANE
+
+#Imports the standard library modules for the timing and the reports
+import contextlib
+import functools
+import json
+import time
+
+#Names of the element types of the type codes of OpticalSystem (the names of the element classes of Optics.py)
+typeNames = {TYPE_MIRROR: 'Mirror', TYPE_FLAT_MIRROR: 'FlatMirror', TYPE_LENS: 'Lens', TYPE_APERTURE: 'Aperture', TYPE_WEDGE_POLARIZER: 'WedgePolarizer', TYPE_INFINITE_PLANE: 'InfinitePlane'}
+
+#Methods of Beam and BeamBatch that are profiled, their first argument is the element (or its geometry dictionary for BeamBatch)
+profiledMethods = ['interact', 'collisionQ', 'collisionPoint', 'refract']
+#Functions of Optics.py that are profiled, they are looked up in Optics.py when called so replacing them in the module is enough
+profiledFunctions = sorted(name for name in dir(Optics) if name.startswith('intersectionBetween') or name.startswith('intersectionsBetween'))
+
+#Class that accumulates the number of calls, number of beams and wall time of each routine per element
+#Times are inclusive, e.g. the time of Beam.interact includes the Beam.collisionQ and intersection calls it makes
+class Profile:
+    def __init__(self):
+        self.reset()
+
+    #Forgets all the counts
+    def reset(self):
+        #{(routine, element ID, element type): [calls, beams, seconds]}
+        self.entries = {}
+
+    #Adds one call of a routine with an element, traced for the given number of beams
+    def record(self, routine, ID, typeName, beams, elapsed):
+        key = (routine, ID, typeName)
+        entry = self.entries.get(key)
+        if entry is None:
+            entry = self.entries[key] = [0, 0, 0.0]
+        entry[0] += 1
+        entry[1] += beams
+        entry[2] += elapsed
+
+    #Returns the counts added up per routine and element ID (by = 'ID') or element type (by = 'Type'), as a list of dictionaries sorted from the slowest
+    def totals(self, by = 'Type'):
+        position = 1 if by == 'ID' else 2
+        totals = {}
+        for key in self.entries:
+            total = totals.setdefault((key[0], key[position]), [0, 0, 0.0])
+            for i in range(3):
+                total[i] += self.entries[key][i]
+        rows = [{"Routine": key[0], by: key[1], "Calls": total[0], "Beams": total[1], "Time": total[2]} for key, total in totals.items()]
+        rows.sort(key = lambda row: -row["Time"])
+        return rows
+
+    #Returns the totals as a text table
+    def table(self, by = 'Type'):
+        lines = ['{:<45}{:<25}{:>12}{:>14}{:>12}{:>14}'.format('Routine', by, 'Calls', 'Beams', 'Time (s)', 'Per call (us)')]
+        for row in self.totals(by):
+            lines.append('{:<45}{:<25}{:>12}{:>14}{:>12.6f}{:>14.3f}'.format(row["Routine"], str(row[by]), row["Calls"], row["Beams"], row["Time"], 1e6*row["Time"]/row["Calls"]))
+        return '\n'.join(lines)
+
+    #Returns the counts per element ID and per element type as a JSON string
+    def toJSON(self):
+        return json.dumps({"ByID": self.totals('ID'), "ByType": self.totals('Type')}, indent = 1)
+
+#Profile where the counts go while profiling is enabled
+profile = Profile()
+#Elements of the profiled methods being run, innermost last, so the intersection functions are counted for the element they are called for
+currentElements = []
+#Original functions replaced while profiling is enabled, {(owner, name): function}
+originals = {}
+
+#Returns the profiled version of a method of Beam or BeamBatch
+def profiledMethod(cls, name, original):
+    routine = cls.__name__ + '.' + name
+    batch = cls is BeamBatch
+    @functools.wraps(original)
+    def wrapper(self, element, *args, **kwargs):
+        if batch:
+            current = (element['ID'], typeNames[element['type']], len(self))
+        else:
+            current = (element.ID, type(element).__name__, 1)
+        currentElements.append(current)
+        start = time.perf_counter()
+        try:
+            return original(self, element, *args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            currentElements.pop()
+            profile.record(routine, current[0], current[1], current[2], elapsed)
+    return wrapper
+
+#Returns the profiled version of a function of Optics.py
+def profiledFunction(name, original):
+    @functools.wraps(original)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return original(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            if currentElements:
+                ID, typeName, beams = currentElements[-1]
+            else:
+                ID, typeName, beams = 'None', 'None', 0
+            profile.record(name, ID, typeName, beams, elapsed)
+    return wrapper
+
+#Replaces the profiled methods and functions with their counting versions, reset = True starts the counts from zero
+def enableProfiling(reset = True):
+    if reset:
+        profile.reset()
+    if originals:
+        return profile
+    for cls in [Beam, BeamBatch]:
+        for name in profiledMethods:
+            originals[(cls, name)] = cls.__dict__[name]
+            setattr(cls, name, profiledMethod(cls, name, cls.__dict__[name]))
+    for name in profiledFunctions:
+        originals[(Optics, name)] = getattr(Optics, name)
+        setattr(Optics, name, profiledFunction(name, getattr(Optics, name)))
+    return profile
+
+#Puts the original methods and functions back, the counts are kept in profile
+def disableProfiling():
+    for (owner, name), original in originals.items():
+        setattr(owner, name, original)
+    originals.clear()
+    del currentElements[:]
+    return profile
+
+#Tells if profiling is enabled
+def profilingEnabled():
+    return bool(originals)
+
+#Context manager that profiles the code inside it and gives the profile
+@contextlib.contextmanager
+def profiling(reset = True):
+    enableProfiling(reset)
+    try:
+        yield profile
+    finally:
+        disableProfiling()
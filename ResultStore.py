@@ -0,0 +1,90 @@
+#Result store of the Initial Allignment Assistant: sweep results in a single binary file, a small JSON header followed by the arrays in a fixed layout
+#The arrays are read back as memory mapped numpy arrays, so plots and post-analysis only read the pages they use, and sweeps can be written tile by tile without fitting in memory
+#Layout of the file:
+#   8 bytes     storeMagic
+#   8 bytes     length of the header, little endian
+#   header      JSON with "Version", "Arrays" ({name: {"dtype", "shape", "offset"}}) and "Metadata" (IDs, view element...)
+#   arrays      raw C ordered data of each array, at its offset from the first multiple of storeAlignment after the header
+#Only needs numpy
+#Imports numpy
+import numpy as np
+#Imports the standard library modules for the header
+import json
+import struct
+
+#First bytes of every store file
+storeMagic = b'IAATSTR1'
+#Version of the layout, stores of other versions are not read
+storeVersion = 1
+#The data and every array start at multiples of this many bytes (the page size), so mapping one array does not touch the others
+storeAlignment = 4096
+
+#Rounds a number of bytes up to a multiple of storeAlignment
+def aligned(size):
+    return -(-size//storeAlignment)*storeAlignment
+
+#Creates a store file with the given arrays, {name: (shape, dtype)}, and metadata (anything that can be written as JSON), and returns it opened for writing (see openStore)
+#The file gets its full size right away, but the arrays are only written when they are assigned, so big sweeps can be filled in tiles
+def createStore(path, arrays, metadata = None):
+    layout = {}
+    offset = 0
+    for name in arrays:
+        shape, dtype = arrays[name]
+        shape = [int(size) for size in np.atleast_1d(shape)]
+        dtype = np.dtype(dtype)
+        layout[name] = {"dtype": dtype.str, "shape": shape, "offset": offset}
+        offset = offset + aligned(int(np.prod(shape))*dtype.itemsize)
+    header = json.dumps({"Version": storeVersion, "Arrays": layout, "Metadata": metadata or {}}).encode('utf-8')
+    start = aligned(16 + len(header))
+    with open(path, 'wb') as f:
+        f.write(storeMagic)
+        f.write(struct.pack('<Q', len(header)))
+        f.write(header)
+        f.truncate(start + offset)
+    return openStore(path, mode = 'r+')
+
+#Returns the header of a store file and where its arrays start
+def readHeader(f):
+    if f.read(8) != storeMagic:
+        raise ValueError("Not a result store file")
+    length = struct.unpack('<Q', f.read(8))[0]
+    header = json.loads(f.read(length).decode('utf-8'))
+    if header["Version"] != storeVersion:
+        raise ValueError("Result store version " + str(header["Version"]) + " is not supported (expected " + str(storeVersion) + ")")
+    return header, aligned(16 + length)
+
+#Opens a store file and returns a dictionary with its metadata and its arrays as numpy memory maps, mode = 'r' to read, 'r+' to write into the arrays
+#The dictionary has the same keys as the result the store was written from, e.g. the one of sweepAlignmentMap
+def openStore(path, mode = 'r'):
+    with open(path, 'rb') as f:
+        header, start = readHeader(f)
+    store = dict(header["Metadata"])
+    for name, layout in header["Arrays"].items():
+        if int(np.prod(layout["shape"])) == 0:
+            store[name] = np.zeros(layout["shape"], dtype = layout["dtype"])
+        else:
+            store[name] = np.memmap(path, dtype = layout["dtype"], mode = mode, offset = start + layout["offset"], shape = tuple(layout["shape"]))
+    return store
+
+#Writes the memory mapped arrays of a store opened for writing to the disk
+def flushStore(store):
+    for value in store.values():
+        if isinstance(value, np.memmap):
+            value.flush()
+
+#Writes a result dictionary (e.g. from sweepAlignmentMap) as a store file, the numeric arrays go into the arrays and everything else into the metadata
+def writeStore(path, result):
+    arrays = {}
+    metadata = {}
+    for name, value in result.items():
+        if isinstance(value, np.ndarray) and value.ndim > 0 and value.dtype.kind in 'biufc':
+            arrays[name] = (value.shape, value.dtype)
+        elif isinstance(value, np.ndarray) or isinstance(value, np.generic):
+            metadata[name] = value.tolist()
+        else:
+            metadata[name] = value
+    store = createStore(path, arrays, metadata)
+    for name in arrays:
+        store[name][...] = result[name]
+    flushStore(store)
+    return path
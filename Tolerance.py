@@ -0,0 +1,124 @@
+#Tolerance analysis of the Initial Allignment Assistant: Monte Carlo of random placement errors of the elements
+#Only needs numpy (and Core.py)
+#Importing the loading and calculation functions form Core.py (and Optics.py through it)
+from Core import *
+
+#Imports numpy
+import numpy as np
+
+#Class that accumulates the statistics of the Monte Carlo samples batch by batch, so its memory does not grow with the number of samples
+class ToleranceStatistics:
+    #Initialization of the class, histogramRange = [[yMin, yMax], [zMin, zMax]] of the beam centers on the view element
+    def __init__(self, elementsIDs, viewID, histogramRange, bins = 50):
+        #IDs of the elements, in order
+        self.elementsIDs = list(elementsIDs)
+        #ID of the element where the beam centers are histogrammed
+        self.viewID = viewID
+        #Number of samples so far
+        self.samples = 0
+        #Number of samples with no flags at all (the beam arrives unclipped at the last element)
+        self.passes = 0
+        #Number of samples where the beam reaches the last element, clipped or not
+        self.reaches = 0
+        #Number of samples with flags on each element
+        self.failures = np.zeros(len(self.elementsIDs), dtype = np.int64)
+        #Number of samples where each element is the first one with flags
+        self.firstFailures = np.zeros(len(self.elementsIDs), dtype = np.int64)
+        #Sums of the beam centers on the view element and of their squares, over the samples that reach it
+        self.centerCount = 0
+        self.centerSum = np.zeros(2)
+        self.centerSumOfSquares = np.zeros(2)
+        #Histogram of the beam centers on the view element, over the samples that reach it
+        self.yEdges = np.linspace(histogramRange[0][0], histogramRange[0][1], num = bins + 1)
+        self.zEdges = np.linspace(histogramRange[1][0], histogramRange[1][1], num = bins + 1)
+        self.histogram = np.zeros((bins, bins), dtype = np.int64)
+
+    #Adds a batch of samples, with their flag codes (count, number of elements) and beam centers on the view element (count, 2)
+    def add(self, flags, centers):
+        failed = flags != 0
+        self.samples = self.samples + len(flags)
+        self.passes = self.passes + int(np.sum(~failed.any(axis = 1)))
+        reached = (flags[:, -1] & FLAG_MISSED) == 0
+        self.reaches = self.reaches + int(np.sum(reached))
+        self.failures += failed.sum(axis = 0)
+        anyFailure = failed.any(axis = 1)
+        self.firstFailures += np.bincount(np.argmax(failed[anyFailure], axis = 1), minlength = len(self.elementsIDs))
+
+        viewReached = (flags[:, self.elementsIDs.index(self.viewID)] & FLAG_MISSED) == 0
+        centers = centers[viewReached]
+        self.centerCount = self.centerCount + len(centers)
+        self.centerSum += centers.sum(axis = 0)
+        self.centerSumOfSquares += (centers**2).sum(axis = 0)
+        self.histogram += np.histogram2d(centers[:, 0], centers[:, 1], bins = [self.yEdges, self.zEdges])[0].astype(np.int64)
+
+    #Returns the statistics so far as a dictionary
+    def summary(self):
+        samples = max(self.samples, 1)
+        centerCount = max(self.centerCount, 1)
+        centerMean = self.centerSum/centerCount
+        return {
+                "ElementsIDs": self.elementsIDs,
+                "ViewID": self.viewID,
+                "Samples": self.samples,
+                "PassRate": self.passes/samples,
+                "ReachRate": self.reaches/samples,
+                "FailureRates": self.failures/samples,
+                "FirstFailureRates": self.firstFailures/samples,
+                "CenterMean": centerMean,
+                "CenterStd": np.sqrt(np.maximum(self.centerSumOfSquares/centerCount - centerMean**2, 0)),
+                "Histogram": self.histogram.copy(),
+                "HistogramEdges": [self.yEdges, self.zEdges]
+               }
+
+#Returns the errors as an array of shape (number of elements,) or (number of elements, 3), from a number, one value per element or one [x, y, z] per element
+def perElement(value, count, components = None):
+    value = np.asarray(value, dtype = float)
+    if components is None:
+        return np.broadcast_to(value, (count,))
+    if value.ndim == 1 and len(value) == count and count != components:
+        value = value[:, np.newaxis]
+    return np.broadcast_to(value, (count, components))
+
+#Traces samples of normally distributed errors in the yaw, pitch (radians) and position of the center of mass of every element and yields the ToleranceStatistics after each batch
+#The standard deviations can be one number for all elements or one per element (and one [x, y, z] per element for the positions)
+#The errors are drawn from independent streams for yaws, pitches and positions seeded by seed, so the same seed gives the same samples whatever the batch size
+def toleranceBatches(beam, elements, yawError = 0.0, pitchError = 0.0, positionError = 0.0, samples = 100000, batchSize = 20000, seed = 0, viewID = None, histogramRange = None, bins = 50):
+    system = compileSystem(elements)
+    count = len(system)
+    if viewID is None:
+        viewID = system.IDs[-1]
+    viewIndex = system.IDs.index(viewID)
+    if histogramRange is None:
+        radius = system.diameter[viewIndex]/2.0
+        histogramRange = [[-radius, radius], [-radius, radius]]
+    yawError = perElement(yawError, count)
+    pitchError = perElement(pitchError, count)
+    positionError = perElement(positionError, count, 3)
+
+    yawStream, pitchStream, positionStream = [np.random.default_rng(stream) for stream in np.random.SeedSequence(seed).spawn(3)]
+    statistics = ToleranceStatistics(system.IDs, viewID, histogramRange, bins = bins)
+    done = 0
+    while done < samples:
+        size = min(batchSize, samples - done)
+        extraYaws = yawStream.standard_normal((size, count))*yawError
+        extraPitches = pitchStream.standard_normal((size, count))*pitchError
+        extraPositions = positionStream.standard_normal((size, count, 3))*positionError
+
+        batch = beam.toBatch(size)
+        flags = batch.calculateFlags(system, extraYaws, extraPitches, extraPositions)
+        state = batch.calculateStates(system, extraYaws, extraPitches, extraPositions)[viewID]
+        #Beam center in the frame of the (moved) view element, same as "BeamCenter" in calculatePlotParameters
+        pitch, yaw = system.angles(viewIndex, extraYaws, extraPitches)
+        centers = rotatePitchYawArray(state.position - system.position(viewIndex, extraPositions), -pitch, -yaw)[:, 1:]
+
+        statistics.add(flags, centers)
+        done = done + size
+        yield statistics
+
+#Runs the whole Monte Carlo of toleranceBatches and returns the summary of its statistics:
+#pass rate (no flags anywhere), reach rate (beam reaches the last element), rate of flags on each element and of each element being the first with flags, mean, standard deviation and histogram of the beam centers on the view element
+def monteCarloTolerance(beam, elements, yawError = 0.0, pitchError = 0.0, positionError = 0.0, samples = 100000, batchSize = 20000, seed = 0, viewID = None, histogramRange = None, bins = 50):
+    statistics = None
+    for statistics in toleranceBatches(beam, elements, yawError = yawError, pitchError = pitchError, positionError = positionError, samples = samples, batchSize = batchSize, seed = seed, viewID = viewID, histogramRange = histogramRange, bins = bins):
+        pass
+    return statistics.summary()
@@ -0,0 +1,137 @@
+#Trace log of the Initial Allignment Assistant: records the propagations and interactions of Beam (element ID, event, distance, position, width) into a preallocated ring buffer
+#Replaces the old verbose prints, nothing is recorded or checked until enableTraceLog is called, it swaps Beam.propagate and Beam.interact for recording versions and disableTraceLog puts them back
+#Usage:
+#   with tracing() as log:
+#       beam.calculateStates(elements)
+#   print('\n'.join(log.lines()))
+#Only needs numpy (and Optics.py)
+from Optics import Beam, norm
+
+#Imports numpy
+import numpy as np
+#Imports contextlib for the with statement version
+import contextlib
+
+#Event types of the trace log
+EVENT_PROPAGATE = 0
+EVENT_INTERACT = 1
+EVENT_MISS = 2
+eventNames = ['Propagate', 'Interact', 'Miss']
+
+#Class that keeps the last capacity events in preallocated arrays, the oldest ones are overwritten when it is full
+class TraceLog:
+    def __init__(self, capacity = 100000):
+        self.capacity = capacity
+        #Index of the element ID of each event in IDs (0 is no element, a propagation outside of an interaction)
+        self.element = np.zeros(capacity, dtype = np.int32)
+        #Event type of each event (EVENT_PROPAGATE, EVENT_INTERACT or EVENT_MISS)
+        self.event = np.zeros(capacity, dtype = np.int8)
+        #Distance travelled in the event, position and width of the beam after it
+        self.distance = np.zeros(capacity)
+        self.position = np.zeros((capacity, 3))
+        self.width = np.zeros(capacity)
+        self.clear()
+
+    #Forgets all the events
+    def clear(self):
+        self.IDs = ['None']
+        self.IDIndex = {'None': 0}
+        #Number of events recorded since the last clear, including the overwritten ones
+        self.count = 0
+
+    #Adds one event
+    def record(self, ID, event, distance, position, width):
+        index = self.IDIndex.get(ID)
+        if index is None:
+            index = self.IDIndex[ID] = len(self.IDs)
+            self.IDs.append(ID)
+        i = self.count % self.capacity
+        self.element[i] = index
+        self.event[i] = event
+        self.distance[i] = distance
+        self.position[i] = position
+        self.width[i] = width
+        self.count = self.count + 1
+
+    #Number of events kept
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    #Number of events overwritten because the log was full
+    def dropped(self):
+        return max(self.count - self.capacity, 0)
+
+    #Returns the events kept, oldest first, as a dictionary of arrays
+    def arrays(self):
+        order = (np.arange(len(self)) + max(self.count - self.capacity, 0)) % self.capacity
+        return {
+                "ElementsIDs": [self.IDs[index] for index in self.element[order]],
+                "Events": self.event[order],
+                "Distances": self.distance[order],
+                "Positions": self.position[order],
+                "Widths": self.width[order]
+               }
+
+    #Returns the events kept, oldest first, as lines of text
+    def lines(self):
+        arrays = self.arrays()
+        lines = []
+        for i in range(len(self)):
+            lines.append(eventNames[arrays["Events"][i]] + " | " + str(arrays["ElementsIDs"][i]) + " | Distance: " + str(arrays["Distances"][i]) + " | Position: " + str(arrays["Positions"][i]) + " | Width: " + str(arrays["Widths"][i]))
+        return lines
+
+#Log where the events go while it is enabled
+traceLog = None
+#IDs of the elements being interacted with, innermost last, so the propagations are recorded for the element they go to
+currentElements = []
+#Original methods of Beam replaced while the log is enabled, {name: function}
+originals = {}
+
+#Returns the recording version of Beam.propagate
+def loggedPropagate(original):
+    def propagate(self, distance):
+        original(self, distance)
+        traceLog.record(currentElements[-1] if currentElements else 'None', EVENT_PROPAGATE, distance, self.position, self.width)
+    return propagate
+
+#Returns the recording version of Beam.interact, the missed elements (where the beam reflects on the plane of the element instead) are recorded as EVENT_MISS
+def loggedInteract(original):
+    def interact(self, element):
+        start = self.position
+        missed = not self.collisionQ(element)
+        currentElements.append(element.ID)
+        try:
+            original(self, element)
+        finally:
+            currentElements.pop()
+        traceLog.record(element.ID, EVENT_MISS if missed else EVENT_INTERACT, norm(self.position - start), self.position, self.width)
+    return interact
+
+#Starts recording the events of all the beams into a new TraceLog that keeps the last capacity events, and returns it
+#Enable and disable it in the reverse order of the profiling of Profiling.py, both replace Beam.interact
+def enableTraceLog(capacity = 100000):
+    global traceLog
+    traceLog = TraceLog(capacity)
+    if not originals:
+        originals['propagate'] = Beam.__dict__['propagate']
+        originals['interact'] = Beam.__dict__['interact']
+        Beam.propagate = loggedPropagate(originals['propagate'])
+        Beam.interact = loggedInteract(originals['interact'])
+    return traceLog
+
+#Stops recording and puts the original methods back, returns the log with the events so far
+def disableTraceLog():
+    for name, original in originals.items():
+        setattr(Beam, name, original)
+    originals.clear()
+    del currentElements[:]
+    return traceLog
+
+#Context manager that records the events of the code inside it and gives the log
+@contextlib.contextmanager
+def tracing(capacity = 100000):
+    log = enableTraceLog(capacity)
+    try:
+        yield log
+    finally:
+        disableTraceLog()
@@ -0,0 +1,165 @@
+#Command line of the Initial Allignment Assistant, runs the sweeps, traces and ranges of Core.py and Alignment.py without Jupyter
+#Usage:
+#   python iaat.py sweep "HAM2 - Default" --movable IM1 IM2 --detail 200 --output ham2.sweep
+#   python iaat.py sweep "HAM2 - Default" --movable IM1 --range=-1e-3,1e-3,-1e-3,1e-3 --detail 200 --output im1.sweep
+#   python iaat.py trace "HAM2 - Default" --offset IM1,1e-4,0 --output trace.npz
+#   python iaat.py ranges "HAM2 - Default" --movable IM1 IM2
+#The systems are the names of the files in the Systems folder (with or without ".ini") or paths to system files
+#The sweeps are written as result stores (see ResultStore.py) while they are traced, the traces and ranges as compressed numpy files (.npz), one array per key of the result dictionaries
+#Only needs numpy (and Core.py)
+#Importing the loading and calculation functions form Core.py (and Optics.py through it)
+from Core import *
+#Importing findRanges to find the ranges of the sweeps that are not given
+from Alignment import findRanges
+
+#Imports numpy
+import numpy as np
+#Imports the standard library modules for the command line
+import argparse
+import json
+import sys
+
+#Folder of this file, where the Systems folder is
+toolDirectory = os.path.dirname(os.path.abspath(__file__))
+
+#Returns the name of a system as the functions of Core.py take it (relative to the Systems folder), from its name or the path to its file
+def systemName(system):
+    if not system.endswith('.ini'):
+        system = system + '.ini'
+    if not os.path.isabs(system) and os.path.isfile(os.path.join(toolDirectory, 'Systems', system)):
+        return system
+    if os.path.isfile(system):
+        return os.path.relpath(os.path.abspath(system), os.path.join(toolDirectory, 'Systems'))
+    raise SystemExit("System not found: " + system)
+
+#Writes a result dictionary as a compressed numpy file, the lists of IDs become arrays of strings and None values are left out
+def writeResult(path, result):
+    arrays = {}
+    for key in result:
+        if result[key] is not None:
+            arrays[key] = np.asarray(result[key])
+    np.savez_compressed(path, **arrays)
+    print("Wrote " + path)
+
+#Returns the 4 numbers of a --range, given as yawMin,yawMax,pitchMin,pitchMax
+def rangeValue(text):
+    values = [float(value) for value in text.split(',')]
+    if len(values) != 4:
+        raise argparse.ArgumentTypeError("expected yawMin,yawMax,pitchMin,pitchMax, got " + text)
+    return values
+
+#Returns the ID, yaw and pitch of an --offset, given as ID,yaw,pitch (the ID can have commas)
+def offsetValue(text):
+    parts = text.rsplit(',', 2)
+    if len(parts) != 3:
+        raise argparse.ArgumentTypeError("expected ID,yaw,pitch, got " + text)
+    return parts[0], float(parts[1]), float(parts[2])
+
+#Returns the ranges of the movable elements, from the command line (one --range yawMin,yawMax,pitchMin,pitchMax per movable element) or from findRanges
+def movableRanges(system, movableIDs, ranges, margin):
+    if ranges is None:
+        return findRanges(system, movableIDs, margin = margin)
+    if len(ranges) != len(movableIDs):
+        raise SystemExit("Give one --range per movable element (" + str(len(movableIDs)) + ")")
+    return [[[ran[0], ran[1]], [ran[2], ran[3]]] for ran in ranges]
+
+def sweepCommand(options):
+    system = options.system
+    ranges = movableRanges(system, options.movable, options.range, options.margin)
+    result = sweepAlignmentMap(system, options.movable, ranges, options.detail, viewID = options.view, tileSize = options.tile_size, processes = options.processes, path = options.output)
+    for i in range(len(options.movable)):
+        clear = ~np.any(result["Flags"][i], axis = -1)
+        print(options.movable[i] + ": yaw " + str(ranges[i][0]) + ", pitch " + str(ranges[i][1]) + ", " + str(int(clear.sum())) + " of " + str(clear.size) + " points without flags")
+    if options.output is not None:
+        print("Wrote " + options.output)
+
+def traceCommand(options):
+    system = options.system
+    beam = beamFromFile('Systems/' + system)
+    elements = elementsFromFile('Systems/' + system)
+    opticalSystem = OpticalSystem(elements)
+    extraYaws = np.zeros(len(opticalSystem))
+    extraPitches = np.zeros(len(opticalSystem))
+    for ID, yaw, pitch in (options.offset or []):
+        if ID not in opticalSystem.IDs:
+            raise SystemExit("No element " + ID + " in " + system)
+        extraYaws[opticalSystem.IDs.index(ID)] = yaw
+        extraPitches[opticalSystem.IDs.index(ID)] = pitch
+
+    batch = beam.toBatch(1)
+    states = batch.calculateStates(opticalSystem, extraYaws, extraPitches)
+    flags = batch.calculateFlags(opticalSystem, extraYaws, extraPitches)[0]
+    centers = np.zeros((len(opticalSystem), 2))
+    for i in range(len(opticalSystem)):
+        pitch, yaw = opticalSystem.angles(i, extraYaws, extraPitches)
+        centers[i] = rotatePitchYaw(states[opticalSystem.IDs[i]].position[0] - opticalSystem.positionOfCM[i], -pitch, -yaw)[1:]
+    result = {
+              "ElementsIDs": list(opticalSystem.IDs),
+              "ExtraYaws": extraYaws,
+              "ExtraPitches": extraPitches,
+              "Positions": np.array([states[ID].position[0] for ID in opticalSystem.IDs]),
+              "Directions": np.array([states[ID].direction[0] for ID in opticalSystem.IDs]),
+              "Widths": np.array([states[ID].width[0] for ID in opticalSystem.IDs]),
+              "RadiiOfCurvature": np.array([states[ID].radiusOfCurvature[0] for ID in opticalSystem.IDs]),
+              "BeamCenters": centers,
+              "Flags": flags
+             }
+    print('{:<30}{:>14}{:>14}{:>14}'.format('Element', 'Center y', 'Center z', 'Width'))
+    for i in range(len(opticalSystem)):
+        print('{:<30}{:>14.6f}{:>14.6f}{:>14.6f}'.format(opticalSystem.IDs[i], centers[i][0], centers[i][1], result["Widths"][i]))
+    for flag in flagMessages(flags, elements):
+        print(flag)
+    if options.output is not None:
+        writeResult(options.output, result)
+
+def rangesCommand(options):
+    system = options.system
+    ranges = findRanges(system, options.movable, margin = options.margin, rays = options.rays, tolerance = options.tolerance)
+    result = dict((options.movable[i], ranges[i]) for i in range(len(options.movable)))
+    print(json.dumps(result, indent = 1))
+    if options.output is not None:
+        writeResult(options.output, {"MovableIDs": list(options.movable), "Ranges": np.array(ranges)})
+
+def main(arguments = None):
+    parser = argparse.ArgumentParser(prog = 'iaat', description = 'Initial Allignment Assistant without Jupyter')
+    commands = parser.add_subparsers(dest = 'command')
+    commands.required = True
+
+    sweep = commands.add_parser('sweep', help = 'flags and beam centers over a grid of yaws and pitches of each movable element')
+    sweep.add_argument('system')
+    sweep.add_argument('--movable', nargs = '+', required = True, help = 'IDs of the elements to sweep')
+    sweep.add_argument('--range', type = rangeValue, action = 'append', metavar = 'YAW_MIN,YAW_MAX,PITCH_MIN,PITCH_MAX', help = 'range of one movable element, in radians, once per movable element (found with findRanges when not given)')
+    sweep.add_argument('--margin', type = float, default = 1.2, help = 'margin of the ranges found with findRanges')
+    sweep.add_argument('--detail', type = int, default = 100, help = 'points per axis')
+    sweep.add_argument('--view', default = None, help = 'ID of the view element (last element by default)')
+    sweep.add_argument('--processes', type = int, default = None, help = 'worker processes (all cores by default)')
+    sweep.add_argument('--tile-size', type = int, default = 20000, help = 'points per task of the workers')
+    sweep.add_argument('--output', default = None, help = 'result store file for the sweep (see ResultStore.py)')
+    sweep.set_defaults(function = sweepCommand)
+
+    trace = commands.add_parser('trace', help = 'beam state and flags on every element')
+    trace.add_argument('system')
+    trace.add_argument('--offset', type = offsetValue, action = 'append', metavar = 'ID,YAW,PITCH', help = 'extra yaw and pitch of one element, in radians')
+    trace.add_argument('--output', default = None, help = '.npz file for the result')
+    trace.set_defaults(function = traceCommand)
+
+    ranges = commands.add_parser('ranges', help = 'yaw and pitch ranges in which the beam reaches the last element')
+    ranges.add_argument('system')
+    ranges.add_argument('--movable', nargs = '+', required = True, help = 'IDs of the movable elements')
+    ranges.add_argument('--margin', type = float, default = 1.2)
+    ranges.add_argument('--rays', type = int, default = 16)
+    ranges.add_argument('--tolerance', type = float, default = 1e-6)
+    ranges.add_argument('--output', default = None, help = '.npz file for the result')
+    ranges.set_defaults(function = rangesCommand)
+
+    options = parser.parse_args(arguments)
+    #The output files are relative to where the command is run, the systems to the folder of the tool
+    if getattr(options, 'output', None) is not None:
+        options.output = os.path.abspath(options.output)
+    options.system = systemName(options.system)
+    os.chdir(toolDirectory)
+    options.function(options)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())